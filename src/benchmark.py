@@ -0,0 +1,197 @@
+"""
+This module benchmarks the hot paths of Bot Evolution (simulation ticks,
+neural network inference, reproduction and rendering) across population sizes
+and food counts, and compares the results against a stored baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+import settings
+import population
+from neural_network import NNetwork
+from world import World
+
+SEED = 12345
+
+def measure(func, budget, setup = None):
+    """
+    Calls 'func' repeatedly for about 'budget' seconds (at least 3 times,
+    after one warm-up call) and returns the median number of seconds per call
+    and the number of calls timed. 'setup', if given, is called before every
+    call and is not timed.
+    """
+    if setup is not None:
+        setup()
+    func()
+    times = []
+    start = time.perf_counter()
+    while len(times) < 3 or time.perf_counter() - start < budget:
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return float(np.median(times)), len(times)
+
+def make_population(bots, food, world = None):
+    """
+    A population of 'bots' bots (with a fixed seed) and 'food' food items.
+    """
+    pop = population.Population(max(bots, 5), 0.1, SEED, world)
+    pop.food_x, pop.food_y = population._random_food_positions(pop.rng.food, food)
+    return pop
+
+def bench_update(bots, food, budget):
+    """
+    Time of one 'Population.update' tick.
+    """
+    pop = make_population(bots, food)
+    return measure(lambda: pop.update(1.0), budget)
+
+def bench_update_rays(bots, food, budget):
+    """
+    Time of one 'Population.update' tick with five distance sensors per bot.
+    """
+    pop = make_population(bots, food, World(food, rays = 5))
+    return measure(lambda: pop.update(1.0), budget)
+
+def bench_feed_forward(bots, food, budget):
+    """
+    Time of one 'NNetwork.feed_forward' call. Population size and food count
+    do not matter.
+    """
+    nnet = NNetwork(population.Population.LAYER_SIZES, population.Population.ACTIVATION_FUNCS, rng = np.random.default_rng(SEED))
+    return measure(lambda: nnet.feed_forward([1.0]), budget)
+
+def bench_batched_feed_forward(bots, food, budget):
+    """
+    Time of feeding a whole population's networks forward at once.
+    """
+    pop = make_population(bots, food)
+    data = pop.rng.spawning.integers(0, 2, len(pop.alive)).astype(float)
+    return measure(lambda: pop.nnet_batch.actions(data, pop.genome), budget)
+
+def bench_feed(bots, food, budget):
+    """
+    Time of one 'Population.feed' event (culling and reproduction).
+    """
+    pop = make_population(bots, food)
+    def feed():
+        pop.feed(pop.best(1)[0], 0)
+        pop._compact()
+    return measure(feed, budget)
+
+def bench_render(bots, food, budget):
+    """
+    Time of one 'main.render' call on an off-screen surface. The population
+    is advanced by a tick (untimed) before every call, so bots move, turn and
+    are replaced as in a real run.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame as pg
+    import main
+    pg.init()
+    window = pg.Surface((settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT))
+    font = pg.font.SysFont("Arial", 30)
+    pop = make_population(bots, food)
+    def render():
+        window.fill((0, 0, 0))
+        main.render(window, font, pop)
+    return measure(render, budget, lambda: pop.update(1.0))
+
+BENCHMARKS = {
+    "update": bench_update,
+    "update_rays": bench_update_rays,
+    "feed_forward": bench_feed_forward,
+    "batched_feed_forward": bench_batched_feed_forward,
+    "feed": bench_feed,
+    "render": bench_render,
+}
+
+# Benchmarks whose cost does not depend on the number of food items.
+FOOD_INDEPENDENT = ("feed_forward", "batched_feed_forward", "feed", "render")
+
+def run(names, sizes, food_counts, budget, log = None):
+    """
+    Runs the benchmarks 'names' for every population size in 'sizes' and food
+    count in 'food_counts', and returns the results.
+    """
+    results = []
+    for name in names:
+        for bots in sizes if name != "feed_forward" else sizes[:1]:
+            for food in food_counts if name not in FOOD_INDEPENDENT else food_counts[:1]:
+                try:
+                    seconds, repeats = BENCHMARKS[name](bots, food, budget)
+                except ImportError as e:
+                    if log is not None:
+                        log("%s: skipped (%s)" % (name, e))
+                    break
+                result = {"name": name, "bots": bots, "food": food, "seconds": seconds, "per_second": 1.0 / seconds, "repeats": repeats}
+                results.append(result)
+                if log is not None:
+                    log("%-22s bots=%-6d food=%-5d %12.3f us %12.1f /s" % (name, bots, food, seconds * 1e6, 1.0 / seconds))
+    return results
+
+def compare(results, baseline, tolerance):
+    """
+    Compares 'results' against the results of a 'baseline' run and returns
+    a list of '(result, ratio)' for every benchmark found in both, where
+    'ratio' is the current time divided by the baseline time, and a list of
+    those that got slower by more than 'tolerance' (e.g. '0.2' for 20%).
+    """
+    key = lambda r: (r["name"], r["bots"], r["food"])
+    previous = {key(r): r for r in baseline["results"]}
+    ratios = [(r, r["seconds"] / previous[key(r)]["seconds"]) for r in results if key(r) in previous]
+    regressions = [(r, ratio) for r, ratio in ratios if ratio > 1 + tolerance]
+    return ratios, regressions
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmarks the hot paths of Bot Evolution.")
+    parser.add_argument("--only", nargs = "+", choices = sorted(BENCHMARKS), default = sorted(BENCHMARKS), help = "benchmarks to run")
+    parser.add_argument("--sizes", nargs = "+", type = int, default = [10, 100, 1000, 10000], help = "population sizes")
+    parser.add_argument("--food", nargs = "+", type = int, default = [1, 10, 100], help = "food counts")
+    parser.add_argument("--budget", type = float, default = 0.5, help = "seconds spent timing every case")
+    parser.add_argument("--output", help = "file to write the JSON results to (default: standard output)")
+    parser.add_argument("--baseline", help = "JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type = float, default = 0.2, help = "slowdown allowed before a case counts as a regression")
+    args = parser.parse_args(argv)
+
+    log = lambda line: print(line, file = sys.stderr)
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "seed": SEED,
+            "budget": args.budget,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": run(args.only, args.sizes, args.food, args.budget, log),
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        ratios, regressions = compare(report["results"], baseline, args.tolerance)
+        report["baseline"] = {"file": args.baseline, "ratios": [dict(r, ratio = ratio) for r, ratio in ratios]}
+        for r, ratio in ratios:
+            log("%-22s bots=%-6d food=%-5d %6.2fx baseline%s" % (r["name"], r["bots"], r["food"], ratio, "  REGRESSION" if ratio > 1 + args.tolerance else ""))
+        if regressions:
+            status = 1
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+    else:
+        print(json.dumps(report, indent = 2))
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
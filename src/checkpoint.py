@@ -0,0 +1,121 @@
+"""
+This module implements periodic checkpointing of a population in the
+background.
+"""
+
+import os
+import re
+import threading
+import time
+import snapshot
+
+class CheckpointManager:
+    """
+    Writes snapshots of a population to a directory without blocking the
+    simulation. The population's state is copied when a checkpoint is taken
+    (which should happen between ticks) and the copy is written on a
+    background thread. Files are written under a temporary name and renamed
+    into place once complete, so a checkpoint on disk is never partial. Only
+    the newest 'keep' checkpoints are kept.
+    """
+
+    def __init__(self, directory, keep = 5, interval = 30 * 60, report = None):
+        """
+        Creates a 'CheckpointManager' writing to 'directory'. 'interval' is the
+        number of seconds (of wall time) between checkpoints, as used by 'due'.
+        'report', if given, is called with every finished checkpoint's path,
+        duration (in seconds) and size (in bytes).
+        """
+        assert(keep >= 1)
+        assert(interval > 0)
+        self.DIRECTORY = directory
+        self.KEEP = keep
+        self.INTERVAL = interval
+        self.report = report
+        self.history = []
+        self.last_time = time.monotonic()
+        self._thread = None
+        os.makedirs(directory, exist_ok = True)
+        existing = self.checkpoints()
+        self._count = _checkpoint_number(existing[-1]) + 1 if existing else 0
+
+    def checkpoints(self):
+        """
+        Paths of the checkpoints in the directory, oldest first.
+        """
+        names = sorted(name for name in os.listdir(self.DIRECTORY) if _CHECKPOINT_NAME.match(name))
+        return [os.path.join(self.DIRECTORY, name) for name in names]
+
+    def latest(self):
+        """
+        Path of the newest checkpoint, or 'None' if there are none.
+        """
+        existing = self.checkpoints()
+        return existing[-1] if existing else None
+
+    def due(self):
+        """
+        Whether 'interval' seconds have passed since the last checkpoint.
+        """
+        return time.monotonic() - self.last_time >= self.INTERVAL
+
+    def busy(self):
+        """
+        Whether a checkpoint is still being written.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def checkpoint(self, pop):
+        """
+        Copies the state of 'pop' and starts writing it in the background.
+        Returns 'False' (and does nothing) if the previous checkpoint is still
+        being written.
+        """
+        if self.busy():
+            return False
+        self.last_time = time.monotonic()
+        captured = snapshot.capture(pop)
+        path = os.path.join(self.DIRECTORY, "checkpoint-%06d.npz" % self._count)
+        self._count += 1
+        self._thread = threading.Thread(target = self._write, args = (path, captured, time.perf_counter()), daemon = True)
+        self._thread.start()
+        return True
+
+    def wait(self):
+        """
+        Blocks until the checkpoint being written (if any) is finished.
+        """
+        if self._thread is not None:
+            self._thread.join()
+
+    def _write(self, path, captured, start):
+        """
+        Writes 'captured' to 'path' atomically, then removes old checkpoints.
+        """
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as f:
+            snapshot.write(f, captured)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+        for old in self.checkpoints()[:-self.KEEP]:
+            os.remove(old)
+        duration = time.perf_counter() - start
+        size = os.path.getsize(path)
+        self.history.append((path, duration, size))
+        if self.report is not None:
+            self.report(path, duration, size)
+
+_CHECKPOINT_NAME = re.compile(r"^checkpoint-(\d+)\.npz$")
+
+def print_report(path, duration, size):
+    """
+    A 'report' callback that prints every finished checkpoint.
+    """
+    print("Saved checkpoint '%s' (%.1f KB) in %.3f s." % (path, size / 1024.0, duration))
+
+def _checkpoint_number(path):
+    """
+    The sequence number of the checkpoint at 'path'.
+    """
+    return int(_CHECKPOINT_NAME.match(os.path.basename(path)).group(1))
@@ -0,0 +1,199 @@
+"""
+This module implements a headless engine that runs Bot Evolution with a fixed
+time step and no rendering, as fast as the CPU allows.
+"""
+
+import argparse
+import json
+import time
+import numpy as np
+import settings
+import population
+import snapshot
+import checkpoint
+import telemetry
+import history
+import replay
+from world import World
+
+class Engine:
+    """
+    Steps a 'Population' with a fixed time step. Nothing is rendered unless an
+    observer (such as a renderer) is attached.
+    """
+
+    def __init__(self, pop, dt = 1.0):
+        """
+        Creates an 'Engine' for 'pop'. 'dt' is the fixed time step of every
+        tick, in the units used by 'Population.update' (a value of '1.0'
+        simulates one frame at 'settings.FPS').
+        """
+        assert(dt > 0)
+        self.pop = pop
+        self.DT = dt
+        self.ticks = 0
+        self.elapsed = 0.0
+        self.observers = []
+
+    def attach(self, observer, every = 1):
+        """
+        Calls 'observer(engine)' after every 'every' ticks.
+        """
+        assert(every >= 1)
+        self.observers.append((observer, every))
+
+    def detach(self, observer):
+        """
+        Stops calling 'observer'.
+        """
+        self.observers = [(o, every) for o, every in self.observers if o is not observer]
+
+    def step(self, n = 1):
+        """
+        Advances the simulation by 'n' ticks.
+        """
+        for i in range(n):
+            self.pop.update(self.DT)
+            self.ticks += 1
+            self.elapsed += 1.0 / settings.FPS * self.DT * settings.TIME_MULTIPLIER
+            for observer, every in self.observers:
+                if self.ticks % every == 0:
+                    observer(self)
+
+    def run_until(self, condition, max_ticks = None):
+        """
+        Advances the simulation until 'condition(engine)' is true (or until
+        'max_ticks' ticks have been run) and returns the number of ticks run.
+        """
+        start = self.ticks
+        while not condition(self):
+            if max_ticks is not None and self.ticks - start >= max_ticks:
+                break
+            self.step()
+        return self.ticks - start
+
+def parse_hidden(text):
+    """
+    Parses hidden layer sizes written as 'a,b,...' (or 'none').
+    """
+    return [] if text == "none" else [int(size) for size in text.split(",")]
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Runs Bot Evolution without a display.")
+    parser.add_argument("--size", type = int, default = 50, help = "population size")
+    parser.add_argument("--mutation-rate", type = float, default = 0.1, help = "mutation rate")
+    parser.add_argument("--seed", type = int, help = "master random seed")
+    parser.add_argument("--hidden", type = parse_hidden, default = list(population.Population.LAYER_SIZES[1:-1]), metavar = "A,B,...", help = "hidden layer sizes of the networks ('none' for no hidden layer)")
+    parser.add_argument("--dt", type = float, default = 1.0, help = "time step of every tick, in frames")
+    parser.add_argument("--ticks", type = int, help = "number of ticks to run")
+    parser.add_argument("--seconds", type = float, help = "number of simulated seconds to run")
+    parser.add_argument("--food", type = int, default = 1, help = "number of food items")
+    parser.add_argument("--rays", type = int, default = 0, help = "number of distance sensors per bot (0 for a single food-in-sight sensor)")
+    parser.add_argument("--ray-spread", type = float, default = 90.0, metavar = "DEGREES", help = "angle the rays are spread over")
+    parser.add_argument("--ray-length", type = float, default = 300.0, metavar = "PIXELS", help = "range of the rays")
+    parser.add_argument("--exact-vision", action = "store_true", help = "test the field of vision exactly instead of in whole degrees (faster, but runs differ from older versions)")
+    parser.add_argument("--load", help = "snapshot to start from")
+    parser.add_argument("--save", help = "snapshot to write when done")
+    parser.add_argument("--checkpoint-dir", help = "directory to write checkpoints to")
+    parser.add_argument("--checkpoint-every", type = int, default = 100000, metavar = "N", help = "ticks between checkpoints")
+    parser.add_argument("--keep", type = int, default = 5, help = "number of checkpoints to keep")
+    parser.add_argument("--watch", type = int, metavar = "N", help = "render every N ticks")
+    parser.add_argument("--telemetry", metavar = "FILE", help = "file to append per-phase timings and event rates to (as JSON lines)")
+    parser.add_argument("--history", metavar = "DIR", help = "directory to record the evolutionary history to")
+    parser.add_argument("--history-every", type = int, default = 1000, metavar = "N", help = "ticks between history statistics")
+    parser.add_argument("--record", metavar = "DIR", help = "directory to record a replay of the run to (see 'main.py --replay')")
+    parser.add_argument("--keyframe-every", type = int, default = 600, metavar = "N", help = "ticks between replay keyframes")
+    parser.add_argument("--telemetry-every", type = int, default = 1000, metavar = "N", help = "ticks between telemetry lines")
+    args = parser.parse_args(argv)
+    if args.ticks is None and args.seconds is None:
+        parser.error("one of --ticks or --seconds is required")
+    if args.size < 5:
+        parser.error("population size must be at least 5")
+    if args.mutation_rate <= 0 or args.mutation_rate >= 1:
+        parser.error("mutation rate must be in the range (0, 1)")
+    if args.food < 1:
+        parser.error("there must be at least 1 food item")
+    if args.rays < 0:
+        parser.error("the number of rays cannot be negative")
+    if any(size < 1 for size in args.hidden):
+        parser.error("hidden layers must have at least 1 neuron")
+    if args.ray_spread < 0:
+        parser.error("the ray spread cannot be negative")
+    if args.ray_length <= 0:
+        parser.error("the ray length must be positive")
+    if args.dt <= 0:
+        parser.error("the time step must be positive")
+    if args.keep < 1:
+        parser.error("at least 1 checkpoint must be kept")
+    for name in ("checkpoint_every", "history_every", "keyframe_every", "telemetry_every", "watch"):
+        if getattr(args, name) is not None and getattr(args, name) < 1:
+            parser.error("--%s must be at least 1" % name.replace("_", "-"))
+
+    if args.load:
+        pop = snapshot.load(args.load)
+    else:
+        world = World(args.food, rays = args.rays, ray_spread = args.ray_spread * np.pi / 180, ray_length = args.ray_length, quantized_vision = not args.exact_vision)
+        pop = population.Population(args.size, args.mutation_rate, args.seed, world, args.hidden)
+    engine = Engine(pop, args.dt)
+
+    checkpoints = None
+    if args.checkpoint_dir:
+        report = lambda path, duration, size: print("saved checkpoint '%s' (%.1f KB) in %.3f s" % (path, size / 1024.0, duration))
+        checkpoints = checkpoint.CheckpointManager(args.checkpoint_dir, args.keep, report = report)
+        engine.attach(lambda e: checkpoints.checkpoint(e.pop), args.checkpoint_every)
+
+    if args.history:
+        pop.history = history.HistoryRecorder(args.history, args.history_every, layer_sizes = pop.LAYER_SIZES, activation_funcs = pop.ACTIVATION_FUNCS)
+
+    recorder = None
+    if args.record:
+        recorder = replay.ReplayRecorder(args.record, args.keyframe_every)
+        engine.attach(lambda e: recorder.record(e.pop))
+
+    if args.telemetry:
+        # Every line covers the ticks since the previous one.
+        pop.telemetry = telemetry.Telemetry(max(args.telemetry_every, 2))
+        telemetry_file = open(args.telemetry, "a")
+        def log(engine):
+            line = dict(engine.pop.telemetry.summary(), elapsed = engine.elapsed, time = time.time())
+            telemetry_file.write(json.dumps(line) + "\n")
+            telemetry_file.flush()
+        engine.attach(log, args.telemetry_every)
+
+    if args.watch:
+        # The renderer is only imported when asked for, so headless runs never
+        # need pygame.
+        import pygame as pg
+        import main as gui
+        pg.init()
+        window = pg.display.set_mode((settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT))
+        pg.display.set_caption("Bot Evolution")
+        font = pg.font.SysFont("Arial", 30)
+        def render(engine):
+            pg.event.pump()
+            window.fill((0, 0, 0))
+            gui.render(window, font, engine.pop)
+            pg.display.update()
+        engine.attach(render, args.watch)
+
+    start = time.perf_counter()
+    if args.ticks is not None:
+        engine.run_until(lambda e: args.seconds is not None and e.elapsed >= args.seconds, args.ticks)
+    else:
+        engine.run_until(lambda e: e.elapsed >= args.seconds)
+    wall = time.perf_counter() - start
+    print("%d ticks (%.1f simulated seconds) in %.2f s: %.0f ticks/s, %d bots, best score %.3f" % (engine.ticks, engine.elapsed, wall, engine.ticks / wall if wall > 0 else 0.0, len(pop.bots), pop.score.max()))
+
+    if args.history:
+        pop.history.close()
+    if recorder is not None:
+        recorder.close()
+    if args.telemetry:
+        telemetry_file.close()
+    if checkpoints is not None:
+        checkpoints.wait()
+    if args.save:
+        snapshot.save(args.save, pop)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+This module implements a recorder that streams the evolutionary history of a
+population (statistics, lineage events and sampled genomes) to disk.
+
+A history is a directory of append-only tables. Every table is stored as a
+sequence of chunk files ('<table>-<number>.npz'), each holding the same columns
+for a block of rows, and 'history.json' describes the run. Chunks are written
+on a background thread, and only one chunk per table is kept in memory, so a
+recorder can run for days.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import numpy as np
+import population
+from neural_network import BatchedNNetwork
+
+class HistoryRecorder:
+    """
+    Records the history of the populations reporting to it (through their
+    'history' attribute, which is 'DISABLED' unless a 'HistoryRecorder' is
+    assigned). Three tables are written:
+
+    'stats'     One row every 'interval' ticks: population and genome counts,
+                the score distribution, how often every action was taken and
+                the genomes of the 'samples' best bots.
+    'feeds'     One row per reproduction: the parent's genome and color and
+                how many children (and mutated children) it had.
+    'mutations' One row per mutated child: the parent's and child's genomes
+                and the child's color.
+
+    Genomes are identified by a 64-bit fingerprint of their parameters, which
+    stays the same across saves and loads.
+    """
+
+    # Scores are binned into 'SCORE_BINS' equal bins over [-1, 1].
+    SCORE_BINS = 20
+    NUM_ACTIONS = 4
+
+    def __init__(self, directory, interval = 1000, samples = 8, chunk_rows = 1024, layer_sizes = None, activation_funcs = None):
+        """
+        Creates a 'HistoryRecorder' appending to the history in 'directory'.
+        A 'stats' row is recorded every 'interval' ticks, and every table is
+        written in chunks of 'chunk_rows' rows. 'layer_sizes' and
+        'activation_funcs' are the shape of the recorded populations' networks
+        ('Population.LAYER_SIZES' and 'Population.ACTIVATION_FUNCS' by
+        default).
+        """
+        assert(interval >= 1)
+        assert(samples >= 0)
+        assert(chunk_rows >= 1)
+        self.DIRECTORY = directory
+        self.INTERVAL = interval
+        self.SAMPLES = samples
+        self.ticks = 0
+        self.elapsed = 0.0
+        self._actions = np.zeros(HistoryRecorder.NUM_ACTIONS, dtype = np.int64)
+        self._feeds = 0
+        self._mutations = 0
+        os.makedirs(directory, exist_ok = True)
+
+        if layer_sizes is None:
+            layer_sizes = population.Population.LAYER_SIZES
+        if activation_funcs is None:
+            activation_funcs = population.Population.ACTIVATION_FUNCS
+        num_params = BatchedNNetwork(layer_sizes, activation_funcs).SIZE
+        meta = {
+            "interval": interval,
+            "samples": samples,
+            "score_bins": HistoryRecorder.SCORE_BINS,
+            "layer_sizes": list(layer_sizes),
+            "activation_funcs": [func.__name__ for func in activation_funcs],
+        }
+        with open(os.path.join(directory, "history.json"), "w") as f:
+            json.dump(meta, f, indent = 2)
+
+        self._writes = queue.Queue(maxsize = 4)
+        self._writer = threading.Thread(target = self._write, daemon = True)
+        self._writer.start()
+        self.tables = {
+            "stats": _Table(self, "stats", chunk_rows, {
+                "tick": (np.int64, ()),
+                "elapsed": (np.float64, ()),
+                "bots": (np.int32, ()),
+                "genomes": (np.int32, ()),
+                "colors": (np.int32, ()),
+                "score_mean": (np.float64, ()),
+                "score_std": (np.float64, ()),
+                "score_quantiles": (np.float64, (5,)),
+                "score_histogram": (np.int32, (HistoryRecorder.SCORE_BINS,)),
+                "actions": (np.int64, (HistoryRecorder.NUM_ACTIONS,)),
+                "feeds": (np.int32, ()),
+                "mutations": (np.int32, ()),
+                "sample_genome": (np.int64, (samples,)),
+                "sample_rgb": (np.uint8, (samples, 3)),
+                "sample_score": (np.float64, (samples,)),
+                "sample_weights": (np.float32, (samples, num_params)),
+            }),
+            "feeds": _Table(self, "feeds", chunk_rows, {
+                "tick": (np.int64, ()),
+                "parent": (np.int64, ()),
+                "parent_rgb": (np.uint8, (3,)),
+                "children": (np.int32, ()),
+                "mutated": (np.int32, ()),
+            }),
+            "mutations": _Table(self, "mutations", chunk_rows, {
+                "tick": (np.int64, ()),
+                "parent": (np.int64, ()),
+                "child": (np.int64, ()),
+                "child_rgb": (np.uint8, (3,)),
+            }),
+        }
+
+    def feed(self, pop, bot, children, mutated):
+        """
+        Records that bot 'bot' of 'pop' reproduced into the bots at indices
+        'children', of which those at 'mutated' got a new genome.
+        """
+        parent = fingerprint(pop.nnet_batch.params[pop.genome[bot]])
+        self._feeds += 1
+        self._mutations += len(mutated)
+        self.tables["feeds"].append(tick = self.ticks, parent = parent, parent_rgb = pop.rgb[bot], children = len(children), mutated = len(mutated))
+        for child in mutated:
+            self.tables["mutations"].append(tick = self.ticks, parent = parent, child = fingerprint(pop.nnet_batch.params[pop.genome[child]]), child_rgb = pop.rgb[child])
+
+    def actions(self, actions):
+        """
+        Records the actions taken by the bots during a tick.
+        """
+        self._actions += np.bincount(actions, minlength = HistoryRecorder.NUM_ACTIONS)[:HistoryRecorder.NUM_ACTIONS]
+
+    def tick(self, pop, step):
+        """
+        Marks the end of a tick of 'step' simulated seconds, recording a
+        'stats' row every 'interval' ticks.
+        """
+        self.ticks += 1
+        self.elapsed += step
+        if self.ticks % self.INTERVAL == 0:
+            self._record_stats(pop)
+
+    def _record_stats(self, pop):
+        """
+        Appends a 'stats' row describing 'pop'.
+        """
+        alive = np.flatnonzero(pop.alive)
+        score = pop.score[alive]
+        best = pop.best(self.SAMPLES)
+        n = len(best)
+        sample_genome = np.zeros(self.SAMPLES, dtype = np.int64)
+        sample_rgb = np.zeros((self.SAMPLES, 3), dtype = np.uint8)
+        sample_score = np.full(self.SAMPLES, np.nan)
+        sample_weights = np.full((self.SAMPLES, pop.nnet_batch.SIZE), np.nan, dtype = np.float32)
+        sample_weights[:n] = pop.nnet_batch.params[pop.genome[best]]
+        sample_genome[:n] = [fingerprint(params) for params in sample_weights[:n]]
+        sample_rgb[:n] = pop.rgb[best]
+        sample_score[:n] = pop.score[best]
+        self.tables["stats"].append(
+            tick = self.ticks,
+            elapsed = self.elapsed,
+            bots = len(alive),
+            genomes = len(np.unique(pop.genome[alive])),
+            colors = len(np.unique(pop.rgb[alive], axis = 0)),
+            score_mean = score.mean() if len(score) else np.nan,
+            score_std = score.std() if len(score) else np.nan,
+            score_quantiles = np.quantile(score, (0, 0.25, 0.5, 0.75, 1)) if len(score) else np.nan,
+            score_histogram = np.histogram(score, HistoryRecorder.SCORE_BINS, (-1.0, 1.0))[0],
+            actions = self._actions,
+            feeds = self._feeds,
+            mutations = self._mutations,
+            sample_genome = sample_genome,
+            sample_rgb = sample_rgb,
+            sample_score = sample_score,
+            sample_weights = sample_weights)
+        self._actions[:] = 0
+        self._feeds = 0
+        self._mutations = 0
+
+    def flush(self):
+        """
+        Writes the rows recorded so far (as possibly partial chunks) and waits
+        until everything is on disk.
+        """
+        for table in self.tables.values():
+            table.flush()
+        self._writes.join()
+
+    def close(self):
+        """
+        Writes the remaining rows and stops the writer thread.
+        """
+        self.flush()
+        self._writes.put(None)
+        self._writer.join()
+
+    def _write(self):
+        """
+        Writes the chunks queued by the tables, until 'None' is queued.
+        """
+        while True:
+            item = self._writes.get()
+            if item is None:
+                self._writes.task_done()
+                return
+            path, columns = item
+            with open(path + ".tmp", "wb") as f:
+                np.savez(f, **columns)
+            os.replace(path + ".tmp", path)
+            self._writes.task_done()
+
+class _Table:
+    """
+    The in-memory chunk of one table of a 'HistoryRecorder'.
+    """
+
+    def __init__(self, recorder, name, chunk_rows, columns):
+        self.recorder = recorder
+        self.NAME = name
+        self.CHUNK_ROWS = chunk_rows
+        self.columns = {column: np.zeros((chunk_rows,) + shape, dtype = dtype) for column, (dtype, shape) in columns.items()}
+        self.rows = 0
+        existing = _chunks(recorder.DIRECTORY, name)
+        self._count = _chunk_number(existing[-1]) + 1 if existing else 0
+
+    def append(self, **row):
+        """
+        Appends a row, writing the chunk out once it is full.
+        """
+        for column, value in row.items():
+            self.columns[column][self.rows] = value
+        self.rows += 1
+        if self.rows == self.CHUNK_ROWS:
+            self.flush()
+
+    def flush(self):
+        """
+        Queues the rows of the chunk for writing and starts a new chunk.
+        """
+        if self.rows == 0:
+            return
+        path = os.path.join(self.recorder.DIRECTORY, "%s-%06d.npz" % (self.NAME, self._count))
+        self.recorder._writes.put((path, {column: values[:self.rows].copy() for column, values in self.columns.items()}))
+        self._count += 1
+        self.rows = 0
+
+class _Disabled:
+    """
+    A stand-in for 'HistoryRecorder' that records nothing.
+    """
+
+    def feed(self, pop, bot, children, mutated):
+        pass
+
+    def actions(self, actions):
+        pass
+
+    def tick(self, pop, step):
+        pass
+
+DISABLED = _Disabled()
+
+def load(directory, table):
+    """
+    Reads every row of 'table' ('stats', 'feeds' or 'mutations') of the
+    history in 'directory', as a dictionary of columns.
+    """
+    chunks = []
+    for path in _chunks(directory, table):
+        with np.load(path) as archive:
+            chunks.append({column: archive[column] for column in archive.files})
+    if not chunks:
+        return {}
+    return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in chunks[0]}
+
+def fingerprint(params):
+    """
+    A 64-bit integer identifying the genome with parameters 'params'.
+    """
+    digest = hashlib.blake2b(np.ascontiguousarray(params, dtype = np.float32).tobytes(), digest_size = 8).digest()
+    return int(np.frombuffer(digest, dtype = np.int64)[0])
+
+_CHUNK_NAME = re.compile(r"^([a-z]+)-(\d+)\.npz$")
+
+def _chunks(directory, table):
+    """
+    Paths of the chunks of 'table' in 'directory', oldest first.
+    """
+    names = sorted(name for name in os.listdir(directory) if _CHUNK_NAME.match(name) and _CHUNK_NAME.match(name).group(1) == table)
+    return [os.path.join(directory, name) for name in names]
+
+def _chunk_number(path):
+    """
+    The sequence number of the chunk at 'path'.
+    """
+    return int(_CHUNK_NAME.match(os.path.basename(path)).group(2))
@@ -0,0 +1,187 @@
+"""
+This module implements island-model evolution: several independent
+populations evolve in parallel worker processes and periodically exchange
+their best bots.
+"""
+
+import argparse
+import multiprocessing
+import time
+import numpy as np
+import settings
+import population
+from engine import Engine
+
+def ring(emigrants, rng):
+    """
+    Migration policy where every island receives the emigrants of the island
+    before it.
+    """
+    return [[emigrants[i - 1]] for i in range(len(emigrants))]
+
+def fully_connected(emigrants, rng):
+    """
+    Migration policy where every island receives the emigrants of every other
+    island.
+    """
+    return [[emigrants[j] for j in range(len(emigrants)) if j != i] for i in range(len(emigrants))]
+
+def random_pairs(emigrants, rng):
+    """
+    Migration policy where every island receives the emigrants of one other
+    island, randomly chosen with 'rng'.
+    """
+    sources = rng.permutation(len(emigrants))
+    while len(emigrants) > 1 and (sources == np.arange(len(emigrants))).any():
+        sources = rng.permutation(len(emigrants))
+    return [[emigrants[source]] for source in sources]
+
+POLICIES = {"ring": ring, "fully-connected": fully_connected, "random": random_pairs}
+
+class IslandModel:
+    """
+    A group of populations ("islands") that each evolve in their own process.
+    Every 'migration_interval' ticks, the best bots of every island are sent
+    to other islands (as decided by the migration policy), where they replace
+    the weakest bots. Only the weights and colors of migrants are sent between
+    processes.
+    """
+
+    def __init__(self, islands, size, mutation_rate, migration_interval = 1000, migrants = 2, policy = ring, dt = 1.0, seed = None):
+        """
+        Starts 'islands' worker processes, each evolving a population of 'size'
+        bots. 'policy' takes the list of every island's emigrants (and a
+        random number generator) and returns, for every island, the list of
+        emigrant groups it receives. Island 'i' is seeded with 'seed + i'.
+        """
+        assert(islands >= 1)
+        assert(migration_interval >= 1)
+        assert(0 <= migrants < size)
+        self.MIGRATION_INTERVAL = migration_interval
+        self.MIGRANTS = migrants
+        self.policy = policy
+        self.rng = np.random.default_rng(seed)
+        self.ticks = 0
+        self.connections = []
+        self.processes = []
+        config = settings.capture()
+        for i in range(islands):
+            parent, child = multiprocessing.Pipe()
+            island_seed = None if seed is None else seed + i
+            process = multiprocessing.Process(target = _island_worker, args = (child, config, size, mutation_rate, dt, island_seed), daemon = True)
+            process.start()
+            self.connections.append(parent)
+            self.processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _broadcast(self, command, args = None):
+        """
+        Sends 'command' to every island (with the matching entry of 'args')
+        and returns their replies.
+        """
+        for i, connection in enumerate(self.connections):
+            connection.send((command, None if args is None else args[i]))
+        return [connection.recv() for connection in self.connections]
+
+    def migrate(self):
+        """
+        Sends the best bots of every island to the islands chosen by the
+        migration policy.
+        """
+        if self.MIGRANTS == 0 or len(self.connections) < 2:
+            return
+        emigrants = self._broadcast("emigrate", [self.MIGRANTS] * len(self.connections))
+        self._broadcast("immigrate", self.policy(emigrants, self.rng))
+
+    def run(self, ticks):
+        """
+        Advances every island by 'ticks' ticks, migrating every
+        'migration_interval' ticks, and returns the latest statistics of every
+        island.
+        """
+        stats = None
+        remaining = ticks
+        while remaining > 0:
+            n = min(remaining, self.MIGRATION_INTERVAL - self.ticks % self.MIGRATION_INTERVAL)
+            stats = self._broadcast("step", [n] * len(self.connections))
+            self.ticks += n
+            remaining -= n
+            if self.ticks % self.MIGRATION_INTERVAL == 0:
+                self.migrate()
+        return stats
+
+    def close(self):
+        """
+        Stops every island.
+        """
+        for connection in self.connections:
+            connection.send(("stop", None))
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+def _island_worker(connection, config, size, mutation_rate, dt, seed):
+    """
+    Evolves one island, following the commands sent over 'connection'.
+    """
+    settings.apply(config)
+    engine = Engine(population.Population(size, mutation_rate, seed), dt)
+    pop = engine.pop
+    while True:
+        command, arg = connection.recv()
+        if command == "step":
+            engine.step(arg)
+            connection.send({"ticks": engine.ticks, "bots": len(pop.bots), "best_score": float(pop.score.max()), "mean_score": float(pop.score.mean())})
+        elif command == "emigrate":
+            connection.send(pop.export_bots(pop.best(arg)))
+        elif command == "immigrate":
+            for weights, rgb in arg:
+                pop.import_bots(weights, rgb)
+            connection.send(None)
+        elif command == "stop":
+            break
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Evolves several populations in parallel, exchanging their best bots.")
+    parser.add_argument("--islands", type = int, default = multiprocessing.cpu_count(), help = "number of islands (processes)")
+    parser.add_argument("--size", type = int, default = 50, help = "population size of every island")
+    parser.add_argument("--mutation-rate", type = float, default = 0.1, help = "mutation rate")
+    parser.add_argument("--ticks", type = int, required = True, help = "number of ticks to run")
+    parser.add_argument("--interval", type = int, default = 1000, help = "ticks between migrations")
+    parser.add_argument("--migrants", type = int, default = 2, help = "bots sent by every island per migration")
+    parser.add_argument("--policy", choices = sorted(POLICIES), default = "ring", help = "migration policy")
+    parser.add_argument("--dt", type = float, default = 1.0, help = "time step of every tick, in frames")
+    parser.add_argument("--seed", type = int, help = "seed of the first island (the others use the following seeds)")
+    args = parser.parse_args(argv)
+    if args.size < 5:
+        parser.error("population size must be at least 5")
+    if args.mutation_rate <= 0 or args.mutation_rate >= 1:
+        parser.error("mutation rate must be in the range (0, 1)")
+    if args.islands < 1:
+        parser.error("there must be at least 1 island")
+    if args.ticks < 0:
+        parser.error("the number of ticks cannot be negative")
+    if args.interval < 1:
+        parser.error("the migration interval must be at least 1 tick")
+    if args.migrants < 0 or args.migrants >= args.size:
+        parser.error("the number of migrants must be in the range [0, size)")
+    if args.dt <= 0:
+        parser.error("the time step must be positive")
+
+    start = time.perf_counter()
+    with IslandModel(args.islands, args.size, args.mutation_rate, args.interval, args.migrants, POLICIES[args.policy], args.dt, args.seed) as model:
+        stats = model.run(args.ticks)
+    wall = time.perf_counter() - start
+    # No statistics are reported if no ticks were run.
+    for i, island in enumerate(stats or []):
+        print("island %d: %d bots, best score %.3f, mean score %.3f" % (i, island["bots"], island["best_score"], island["mean_score"]))
+    print("%d islands x %d ticks in %.2f s: %.0f ticks/s" % (args.islands, args.ticks, wall, args.islands * args.ticks / wall if wall > 0 else 0.0))
+
+if __name__ == "__main__":
+    main()
@@ -2,28 +2,193 @@
 Bot Evolution v1.0.0
 """
 
+import argparse
+import json
 import os
 import sys
-import pickle
-import pygame as pg
-from pygame.locals import *
-import numpy as np
-import datetime
 import settings
 import population
+import snapshot
+import checkpoint
+import telemetry
+import replay
+from world import World
+from engine import parse_hidden
 
-def main():
-    np.random.seed()
-    pg.init()
+# pygame and the renderer are only imported once something is drawn (see
+# 'load_pygame'), so that setting up a run (and importing this module) is
+# fast.
+pg = None
+renderer = None
+
+SAVE_FILE = "save.npz"
+CHECKPOINT_DIR = "checkpoints"
+
+# The options of a run and their defaults. A config file is a JSON object with
+# some of these keys; the matching command line arguments override it.
+DEFAULTS = {
+    "load": None,
+    "size": 50,
+    "mutation_rate": 0.1,
+    "seed": None,
+    "time_multiplier": 1.0,
+    "fps": settings.FPS,
+    "window_width": settings.WINDOW_WIDTH,
+    "window_height": settings.WINDOW_HEIGHT,
+    "food": 1,
+    "rays": 0,
+    "exact_vision": False,
+    "hidden": list(population.Population.LAYER_SIZES[1:-1]),
+    "periodic_saves": False,
+    "worker": False,
+}
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Bot Evolution. The run is set up interactively unless a config file or any of its options is given.")
+    parser.add_argument("--replay", metavar = "DIR", help = "play back the replay recorded in DIR instead of simulating")
+    parser.add_argument("--record", metavar = "DIR", help = "record a replay of the run to DIR")
+    parser.add_argument("--config", metavar = "FILE", help = "JSON file with the options of the run (see 'main.DEFAULTS')")
+    parser.add_argument("--load", metavar = "FILE", help = "snapshot to start from")
+    parser.add_argument("--size", type = int, help = "population size")
+    parser.add_argument("--mutation-rate", type = float, help = "mutation rate")
+    parser.add_argument("--seed", type = int, help = "master random seed")
+    parser.add_argument("--time-multiplier", type = float, help = "time multiplier")
+    parser.add_argument("--fps", type = int, help = "frames per second")
+    parser.add_argument("--window-width", type = int, help = "window width")
+    parser.add_argument("--window-height", type = int, help = "window height")
+    parser.add_argument("--food", type = int, help = "number of food items")
+    parser.add_argument("--rays", type = int, help = "number of distance sensors per bot (0 for a single food-in-sight sensor)")
+    parser.add_argument("--exact-vision", action = "store_true", default = None, help = "test the field of vision exactly instead of in whole degrees")
+    parser.add_argument("--hidden", type = parse_hidden, metavar = "A,B,...", help = "hidden layer sizes of the networks ('none' for no hidden layer)")
+    parser.add_argument("--periodic-saves", action = "store_true", default = None, help = "save a checkpoint every half hour")
+    parser.add_argument("--worker", action = "store_true", default = None, help = "simulate in a separate process")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        recording = replay.Replay(args.replay)
+        settings.FPS = recording.meta["settings"]["fps"]
+        settings.WINDOW_WIDTH = recording.meta["settings"]["window_width"]
+        settings.WINDOW_HEIGHT = recording.meta["settings"]["window_height"]
+        print("\nNote: ")
+        print("\tPress 'p' or 'space' to pause / unpause.")
+        print("\tPress 'up' / 'down' to double / halve the playback speed.")
+        print("\tPress 'left' / 'right' to seek 5 seconds (or one tick while paused).")
+        print("\tPress 'home' / 'end' to seek to the start / end.")
+        print("\tClick on the bar at the bottom to seek.")
+        window = open_window("Bot Evolution (replay)")
+        playback(window, pg.font.SysFont("Arial", 30), pg.time.Clock(), recording)
+        pg.quit()
+        sys.exit()
 
     # Initialize runtime variables.
-    periodically_save = False
+    checkpoints = None
     pop = None
-    if os.path.isfile("save.txt") and input("Save file detected! Use it? (y/n): ").lower() == 'y':
-        settings.FPS, settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT, settings.TIME_MULTIPLIER, pop = pickle.load(open("save.txt", "rb"))
+    given = {name: value for name, value in vars(args).items() if name in DEFAULTS and value is not None}
+    if args.config or given:
+        options = dict(DEFAULTS)
+        if args.config:
+            with open(args.config) as f:
+                config = json.load(f)
+            unknown = sorted(set(config) - set(DEFAULTS))
+            if unknown:
+                parser.error("unknown options in '%s': %s" % (args.config, ", ".join(unknown)))
+            options.update(config)
+        options.update(given)
+        error = check_options(options)
+        if error is not None:
+            parser.error(error)
+        pop = start(options)
+        periodic_saves = options["periodic_saves"]
+        in_worker = options["worker"]
+    else:
+        pop, periodic_saves, in_worker = prompt()
+    if periodic_saves and not in_worker:
+        checkpoints = checkpoint.CheckpointManager(CHECKPOINT_DIR, report = checkpoint.print_report)
+    recorder = None
+    if args.record:
+        if in_worker:
+            print("Replays are not recorded when simulating in a separate process.")
+        else:
+            recorder = replay.ReplayRecorder(args.record)
+    print("\nNote: ")
+    print("\tPress 'r' to reset the population.")
+    print("\tPress 'p' to pause / unpause.")
+    print("\tPress 't' to show / hide where the time of a tick goes.")
+    print("\tPress 's' to save population's data (for use next time).")
+    print("\tPress 'up' / 'down' to change the populations mutation rate.")
+    print("\tPress 'left' / 'right' to change the time multiplier.")
+    print("\tClick on the screen to lay down food.")
+
+    # Core variables.
+    window = open_window("Bot Evolution")
+    FONT_SIZE = 30
+    FONT = pg.font.SysFont("Arial", FONT_SIZE)
+    fps_clock = pg.time.Clock()
+
+    if in_worker:
+        # The worker needs 'multiprocessing.shared_memory' (Python 3.8), so it
+        # is only imported when asked for.
+        from worker import SimulationWorker
+        with SimulationWorker(pop, checkpoint_dir = CHECKPOINT_DIR if periodic_saves else None) as simulation:
+            worker_loop(window, FONT, fps_clock, simulation)
+        pg.quit()
+        sys.exit()
+
+    # Main loop.
+    dt = 0.0
+    fps_clock.tick(int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1)))
+    paused = False
+    while True:
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                if checkpoints is not None:
+                    checkpoints.wait()
+                if recorder is not None:
+                    recorder.close()
+                pg.quit()
+                sys.exit()
+            elif event.type == pg.KEYDOWN:
+                if event.key == pg.K_r:
+                    pop_telemetry = pop.telemetry
+                    pop = population.Population(pop.SIZE, pop.mutation_rate, world = pop.world, hidden = pop.HIDDEN)
+                    pop.telemetry = pop_telemetry
+                if event.key == pg.K_s:
+                    snapshot.save(SAVE_FILE, pop)
+                if event.key == pg.K_p:
+                    paused = not paused
+                if event.key == pg.K_t:
+                    pop.telemetry = telemetry.Telemetry() if pop.telemetry is telemetry.DISABLED else telemetry.DISABLED
+            elif event.type == pg.MOUSEBUTTONUP:
+                pos = pg.mouse.get_pos()
+                pop.place_food(pos[0], pos[1])
+        if paused:
+            dt = fps_clock.tick(int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))) / 1000.0 * int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))
+            continue
+        if checkpoints is not None and checkpoints.due():
+            checkpoints.checkpoint(pop)
+        update(dt, pop, pressed_keys())
+        if recorder is not None:
+            recorder.record(pop)
+        with pop.telemetry.phase("render"):
+            window.fill((0, 0, 0))
+            render(window, FONT, pop)
+            pg.display.update()
+        dt = fps_clock.tick(int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))) / 1000.0 * int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))
+
+def prompt():
+    """
+    Asks how to set up the run. Returns the population and whether to save
+    periodically and to simulate in a separate process.
+    """
+    latest_checkpoint = checkpoint.CheckpointManager(CHECKPOINT_DIR).latest() if os.path.isdir(CHECKPOINT_DIR) else None
+    if os.path.isfile(SAVE_FILE) and input("Save file detected! Use it? (y/n): ").lower() == 'y':
+        pop = snapshot.load(SAVE_FILE)
+    elif latest_checkpoint is not None and input("Checkpoint detected! Use it? (y/n): ").lower() == 'y':
+        pop = snapshot.load(latest_checkpoint)
     else:
         pop_size = 0
         mutation_rate = 0
+        world = World()
         while True:
             pop_size = int(input("Population size: "))
             if pop_size < 5:
@@ -61,76 +226,194 @@ def main():
                     print("Window height must be at least 50!")
                 else:
                     break
-        pop = population.Population(pop_size, mutation_rate)
-    if input("Periodically save every half hour? (y/n): ").lower() == 'y':
-        periodically_save = True
-    print("\nNote: ")
-    print("\tPress 'r' to reset the population.")
-    print("\tPress 'p' to pause / unpause.")
-    print("\tPress 's' to save population's data (for use next time).")
-    print("\tPress 'up' / 'down' to change the populations mutation rate.")
-    print("\tPress 'left' / 'right' to change the time multiplier.")
-    print("\tClick on the screen to lay down food.")
+            while True:
+                food = int(input("Food items: "))
+                if food < 1:
+                    print("There must be at least 1 food item!")
+                else:
+                    break
+            while True:
+                rays = int(input("Sensor rays per bot (0 for a single food-in-sight sensor): "))
+                if rays < 0:
+                    print("The number of rays cannot be negative!")
+                else:
+                    break
+            exact_vision = input("Test the field of vision exactly rather than in whole degrees? (y/n): ").lower() == 'y'
+            world = World(food, rays = rays, quantized_vision = not exact_vision)
+        pop = population.Population(pop_size, mutation_rate, world = world)
+    periodic_saves = input("Periodically save every half hour? (y/n): ").lower() == 'y'
+    in_worker = input("Simulate in a separate process? (y/n): ").lower() == 'y'
+    return pop, periodic_saves, in_worker
 
-    # Core variables.
-    FONT_SIZE = 30
-    FONT = pg.font.SysFont("Arial", FONT_SIZE)
-    fps_clock = pg.time.Clock()
+def check_options(options):
+    """
+    Why the options of a run are invalid, or 'None' if they are valid.
+    """
+    if options["size"] < 5:
+        return "population size must be at least 5"
+    if options["mutation_rate"] <= 0 or options["mutation_rate"] >= 1:
+        return "mutation rate must be in the range (0, 1)"
+    if options["time_multiplier"] < 1:
+        return "time multiplier must be at least 1"
+    if options["fps"] < 1:
+        return "FPS must be at least 1"
+    if options["window_width"] < 50 or options["window_height"] < 50:
+        return "window width and height must be at least 50"
+    if options["food"] < 1:
+        return "there must be at least 1 food item"
+    if options["rays"] < 0:
+        return "the number of rays cannot be negative"
+    if any(size < 1 for size in options["hidden"]):
+        return "hidden layers must have at least 1 neuron"
+    return None
+
+def start(options):
+    """
+    Applies the settings of the (checked) options of a run and creates its
+    population, or loads it (with its saved settings) if 'load' is set.
+    """
+    settings.FPS = options["fps"]
+    settings.WINDOW_WIDTH = options["window_width"]
+    settings.WINDOW_HEIGHT = options["window_height"]
+    settings.TIME_MULTIPLIER = float(options["time_multiplier"])
+    if options["load"]:
+        return snapshot.load(options["load"])
+    world = World(options["food"], rays = options["rays"], quantized_vision = not options["exact_vision"])
+    return population.Population(options["size"], options["mutation_rate"], options["seed"], world, options["hidden"])
+
+def load_pygame():
+    """
+    Imports pygame and creates the renderer, the first time it is called.
+    """
+    global pg, renderer
+    if pg is None:
+        import pygame
+        from renderer import Renderer
+        pg = pygame
+        renderer = Renderer()
+
+def open_window(caption):
+    """
+    Initializes pygame and opens the window.
+    """
+    load_pygame()
+    pg.init()
     window = pg.display.set_mode((settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT))
-    pg.display.set_caption("Bot Evolution")
+    pg.display.set_caption(caption)
+    return window
 
-    # Main loop.
+def pressed_keys():
+    """
+    Which of the arrow keys are held down (opposite keys cancel out).
+    """
+    key_pressed = {"up": False, "down": False, "left": False, "right": False}
+    keys = pg.key.get_pressed()
+    if keys[pg.K_UP]:
+        key_pressed["up"] = True
+    if keys[pg.K_DOWN]:
+        key_pressed["down"] = True
+    if key_pressed["up"] and key_pressed["down"]:
+        key_pressed["up"] = False
+        key_pressed["down"] = False
+    if keys[pg.K_LEFT]:
+        key_pressed["left"] = True
+    if keys[pg.K_RIGHT]:
+        key_pressed["right"] = True
+    if key_pressed["left"] and key_pressed["right"]:
+        key_pressed["left"] = False
+        key_pressed["right"] = False
+    return key_pressed
+
+def worker_loop(window, FONT, fps_clock, simulation):
+    """
+    The main loop while the population is stepped by 'simulation' (a
+    'SimulationWorker'): input is sent to the worker, and the latest frame it
+    published is drawn.
+    """
     dt = 0.0
-    fps_clock.tick(int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1)))
-    paused = False
     while True:
-        key_pressed = {"up": False, "down": False, "left": False, "right": False}
         for event in pg.event.get():
-            if event.type == QUIT:
-                pg.quit()
-                sys.exit()
+            if event.type == pg.QUIT:
+                return
             elif event.type == pg.KEYDOWN:
                 if event.key == pg.K_r:
-                    pop = population.Population(pop.SIZE, pop.mutation_rate)
+                    simulation.reset()
                 if event.key == pg.K_s:
-                    pickle.dump([settings.FPS, settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT, settings.TIME_MULTIPLIER, pop], open("save.txt", "wb"))
+                    simulation.save(SAVE_FILE)
                 if event.key == pg.K_p:
+                    simulation.toggle_pause()
+            elif event.type == pg.MOUSEBUTTONUP:
+                pos = pg.mouse.get_pos()
+                simulation.place_food(pos[0], pos[1])
+        time_multiplier = settings.TIME_MULTIPLIER
+        adjust(dt, simulation, pressed_keys())
+        if settings.TIME_MULTIPLIER != time_multiplier:
+            simulation.set_time_multiplier(settings.TIME_MULTIPLIER)
+        frame = simulation.frames.acquire()
+        if frame is not None:
+            window.fill((0, 0, 0))
+            render(window, FONT, frame)
+            simulation.frames.release()
+            pg.display.update()
+        dt = fps_clock.tick(settings.FPS) / 1000.0 * settings.FPS
+
+def playback(window, FONT, fps_clock, recording):
+    """
+    Plays back 'recording' (a 'replay.Replay') with the renderer alone: no
+    population is simulated. The playback speed is the number of recorded
+    ticks shown per frame, so fractional and very high speeds both work.
+    """
+    BAR_HEIGHT = 8
+    last = len(recording) - 1
+    if last < 0:
+        print("The replay is empty.")
+        return
+    position = 0.0
+    speed = 1.0
+    paused = False
+    seek = 5 * settings.FPS
+    while True:
+        for event in pg.event.get():
+            if event.type == pg.QUIT:
+                return
+            elif event.type == pg.KEYDOWN:
+                if event.key in (pg.K_p, pg.K_SPACE):
                     paused = not paused
+                elif event.key == pg.K_UP:
+                    speed = min(speed * 2, 1024.0)
+                elif event.key == pg.K_DOWN:
+                    speed = max(speed / 2, 1.0 / 64)
+                elif event.key == pg.K_LEFT:
+                    position -= 1 if paused else seek
+                elif event.key == pg.K_RIGHT:
+                    position += 1 if paused else seek
+                elif event.key == pg.K_HOME:
+                    position = 0.0
+                elif event.key == pg.K_END:
+                    position = last
             elif event.type == pg.MOUSEBUTTONUP:
                 pos = pg.mouse.get_pos()
-                pop.food.pop()
-                food = population.Food(pop)
-                food.x = pos[0]
-                food.y = pos[1]
-                pop.food.append(food)
-        if paused:
-            dt = fps_clock.tick(int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))) / 1000.0 * int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))
-            continue
-        if periodically_save and datetime.datetime.now().minute % 30 == 0:
-            pickle.dump([settings.FPS, settings.WINDOW_WIDTH, settings.WINDOW_HEIGHT, settings.TIME_MULTIPLIER, pop], open("save.txt", "wb"))
-        keys = pg.key.get_pressed()
-        if keys[pg.K_UP]:
-            key_pressed["up"] = True
-        if keys[pg.K_DOWN]:
-            key_pressed["down"] = True
-        if key_pressed["up"] and key_pressed["down"]:
-            key_pressed["up"] = False
-            key_pressed["down"] = False
-        if keys[pg.K_LEFT]:
-            key_pressed["left"] = True
-        if keys[pg.K_RIGHT]:
-            key_pressed["right"] = True
-        if key_pressed["left"] and key_pressed["right"]:
-            key_pressed["left"] = False
-            key_pressed["right"] = False
-        update(dt, pop, key_pressed)
+                if pos[1] >= settings.WINDOW_HEIGHT - 4 * BAR_HEIGHT:
+                    position = pos[0] / float(settings.WINDOW_WIDTH) * last
+        if not paused:
+            position += speed
+        position = min(max(position, 0.0), last)
+        tick = int(position)
+
         window.fill((0, 0, 0))
-        render(window, FONT, pop)
+        renderer.draw(window, recording.frame(tick))
+        resultSurf = FONT.render("Tick %d / %d       Speed: %gx%s" % (tick, last, speed, "       Paused" if paused else ""), True, (255, 255, 255))
+        window.blit(resultSurf, (25, 25))
+        pg.draw.rect(window, (80, 80, 80), (0, settings.WINDOW_HEIGHT - BAR_HEIGHT, settings.WINDOW_WIDTH, BAR_HEIGHT))
+        pg.draw.rect(window, (255, 255, 255), (0, settings.WINDOW_HEIGHT - BAR_HEIGHT, int(settings.WINDOW_WIDTH * tick / max(last, 1)), BAR_HEIGHT))
         pg.display.update()
-        dt = fps_clock.tick(int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))) / 1000.0 * int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))
+        fps_clock.tick(settings.FPS)
 
 display_time_remaining = 0.0
-def update(dt, pop, key_pressed):
+def adjust(dt, pop, key_pressed):
+    """
+    Changes the mutation rate and time multiplier with the arrow keys.
+    """
     global display_time_remaining
     if key_pressed["up"] or key_pressed["down"] or key_pressed["left"] or key_pressed["right"]:
         display_time_remaining = 3.0
@@ -155,25 +438,14 @@ def update(dt, pop, key_pressed):
         if display_time_remaining < 0:
             display_time_remaining = 0.0
 
+def update(dt, pop, key_pressed):
+    adjust(dt, pop, key_pressed)
     pop.update(dt)
 
+telemetry_font = None
 def render(window, FONT, pop):
-    for food in pop.food:
-        pg.draw.circle(window, food.RGB, (int(food.x), int(food.y)), food.HITBOX_RADIUS)
-
-    for bot in pop.bots:
-        # Draw body.
-        pg.draw.circle(window, bot.RGB, (int(bot.x), int(bot.y)), bot.HITBOX_RADIUS)
-
-        # Draw field-of-vision lines.
-        LINE_THICKNESS = 1
-        PROTRUSION = int(bot.HITBOX_RADIUS * 1.5)
-        to_x = int(bot.x + (bot.HITBOX_RADIUS + PROTRUSION) * np.cos(bot.theta - bot.FIELD_OF_VISION_THETA / 2))
-        to_y = int(bot.y - (bot.HITBOX_RADIUS + PROTRUSION) * np.sin(bot.theta - bot.FIELD_OF_VISION_THETA / 2))
-        pg.draw.line(window, bot.RGB, (bot.x, bot.y), (to_x, to_y), LINE_THICKNESS)
-        to_x = int(bot.x + (bot.HITBOX_RADIUS + PROTRUSION) * np.cos(bot.theta + bot.FIELD_OF_VISION_THETA / 2))
-        to_y = int(bot.y - (bot.HITBOX_RADIUS + PROTRUSION) * np.sin(bot.theta + bot.FIELD_OF_VISION_THETA / 2))
-        pg.draw.line(window, bot.RGB, (bot.x, bot.y), (to_x, to_y), LINE_THICKNESS)
+    load_pygame()
+    renderer.draw(window, pop)
 
     if display_time_remaining > 0:
         resultSurf = FONT.render("Mutation Rate: %.3f       Speed: %.1fx" % (pop.mutation_rate, settings.TIME_MULTIPLIER), True, (255, 255, 255))
@@ -181,5 +453,14 @@ def render(window, FONT, pop):
         resultRect.topleft = (25, 25)
         window.blit(resultSurf, resultRect)
 
+    if isinstance(getattr(pop, "telemetry", None), telemetry.Telemetry):
+        global telemetry_font
+        if telemetry_font is None:
+            telemetry_font = pg.font.SysFont("Arial", 16)
+        top = 25 + FONT.get_linesize()
+        for line in pop.telemetry.lines():
+            window.blit(telemetry_font.render(line, True, (255, 255, 255)), (25, top))
+            top += telemetry_font.get_linesize()
+
 if __name__ == "__main__":
     main()
@@ -3,27 +3,36 @@ This module implements the neural network class and all components necessary to
 modularize the build/use process of the neural network.
 """
 
+import itertools
 import numpy as np
 import pickle
 
 class NNetwork:
     """
     The representation of a feed forward neural network with a bias in every
-    layer (excluding output layer obviously).
+    layer (excluding output layer obviously). All weights are stored in one
+    contiguous float32 parameter vector ('params'); the weights of every
+    connection are a view of it. Networks can share their parameter vector
+    (see 'clone'), in which case it is read-only and copied on first change.
     """
 
-    def __init__(self, layer_sizes, activation_funcs, bias_neuron = False):
+    def __init__(self, layer_sizes, activation_funcs, bias_neuron = False, rng = None, weights = None, params = None):
         """
         Creates a 'NNetwork'. 'layer_sizes' provides information about the
         number of neurons in each layer, as well as the total number of layers
         in the neural network. 'activation_funcs' provides information about the
         activation functions to use on each respective hidden layers and output
         layer. This means that the length of 'activation_funcs' is always one
-        less than the length of 'layer_sizes'.
+        less than the length of 'layer_sizes'. Weights are drawn from 'rng' (a
+        'numpy.random.Generator', or the global NumPy generator if 'None'),
+        unless 'weights' provides (a copy of) the weights of every connection
+        or 'params' provides a parameter vector to share.
         """
         assert(len(layer_sizes) >= 2)
         assert(len(layer_sizes) - 1 == len(activation_funcs))
         assert(min(layer_sizes) >= 1)
+        self.LAYER_SIZES = tuple(layer_sizes)
+        self.ACTIVATION_FUNCS = tuple(activation_funcs)
         self.layers = []
         self.connections = []
 
@@ -39,34 +48,90 @@ class NNetwork:
             else:
                 self.layers.append(Layer(layer_sizes[i], activation_funcs[i - 1]))
 
-        # Initialize connections.
-        num_connections = len(layer_sizes) - 1
-        for i in range(num_connections):
-            self.connections.append(Connection(self.layers[i], self.layers[i + 1]))
+        # Initialize parameters. Random weights are drawn in a guassian
+        # distribution of mean '0' and standard deviation '1'.
+        num_params = sum(self.layers[i].SIZE * self.layers[i + 1].SIZE for i in range(len(self.layers) - 1))
+        if params is not None:
+            assert(np.shape(params) == (num_params,))
+            self.params = np.asarray(params, dtype = np.float32).view()
+            self.params.flags.writeable = False
+        elif weights is not None:
+            self.params = np.concatenate([np.asarray(w, dtype = np.float32).ravel() for w in weights])
+        else:
+            if rng is None:
+                rng = np.random
+            self.params = rng.standard_normal(num_params).astype(np.float32)
+        assert(len(self.params) == num_params)
+        self._connect()
+
+    def _connect(self):
+        """
+        (Re)creates the connections as views of the parameter vector.
+        """
+        self.connections = []
+        start = 0
+        for i in range(len(self.layers) - 1):
+            size = self.layers[i].SIZE * self.layers[i + 1].SIZE
+            weights = self.params[start:start + size].reshape(self.layers[i].SIZE, self.layers[i + 1].SIZE)
+            self.connections.append(Connection(self.layers[i], self.layers[i + 1], weights = weights))
+            start += size
+
+    def is_shared(self):
+        """
+        Whether the parameter vector is shared with other networks (and thus
+        read-only).
+        """
+        return not self.params.flags.writeable
+
+    def clone(self):
+        """
+        Creates a 'NNetwork' sharing this network's parameter vector. Neither
+        network copies it until it is changed through 'mutate'.
+        """
+        if not self.is_shared():
+            self.params = self.params.view()
+            self.params.flags.writeable = False
+            self._connect()
+        return NNetwork(self.LAYER_SIZES, self.ACTIVATION_FUNCS, self.layers[0].HAS_BIAS_NEURON, params = self.params)
+
+    def mutate(self, rate, rng = None):
+        """
+        Mutates the network's weights (see 'mutate'), copying the parameter
+        vector first if it is shared.
+        """
+        if rng is None:
+            rng = np.random.default_rng()
+        self.params = mutate(self.params[None, :], rate, rng)[0]
+        self._connect()
 
     def feed_forward(self, data, one_hot_encoding = True):
         """
         Feeds given data through neural network and stores output in output
-        layer's data field. Output can optionally be one-hot encoded.
+        layer's data field. Output can optionally be one-hot encoded (which
+        overwrites the activations; use 'action' to keep them). 'data' is
+        copied into the network's preallocated buffers and is not modified.
         """
-        if self.layers[0].HAS_BIAS_NEURON:
-            assert(len(data) == self.layers[0].SIZE - 1)
-            self.layers[0].data = data
-            self.layers[0].data.append(1)
+        input_layer = self.layers[0]
+        if input_layer.HAS_BIAS_NEURON:
+            assert(len(data) == input_layer.SIZE - 1)
+            input_layer.data[:-1] = data
         else:
-            assert(len(data) == self.layers[0].SIZE)
-            self.layers[0].data = data
-        for i in range(len(self.connections)):
-            self.connections[i].TO.data = np.dot(self.layers[i].data, self.connections[i].weights)
-            self.connections[i].TO.activate()
+            assert(len(data) == input_layer.SIZE)
+            input_layer.data[:] = data
+        for connection in self.connections:
+            np.dot(connection.FROM.data, connection.weights, out = connection.TO.data)
+            connection.TO.activate()
         if one_hot_encoding:
-            this_data = self.layers[len(self.layers) - 1].data
-            MAX = max(this_data)
-            for i in range(len(this_data)):
-                if this_data[i] == MAX:
-                    this_data[i] = 1
-                else:
-                    this_data[i] = 0
+            output = self.output()
+            output[...] = output == output.max()
+
+    def action(self, data):
+        """
+        Feeds given data through neural network and returns the index of the
+        strongest output neuron. The output layer's activations are kept.
+        """
+        self.feed_forward(data, one_hot_encoding = False)
+        return int(np.argmax(self.output()))
 
     def output(self):
         """
@@ -84,17 +149,19 @@ class Layer:
         """
         Creates a 'Layer' with 'num_neurons' and an additional (optional) bias
         neuron (which always has a value of '1'). The layer will utilize the
-        'activation_func' during activation.
+        'activation_func' during activation. The layer's data is a float32
+        buffer that is reused by every pass through the network.
         """
         assert(num_neurons > 0)
         self.ACTIVATION_FUNC = activation_func
         self.HAS_BIAS_NEURON = bias_neuron
         if bias_neuron:
             self.SIZE = num_neurons + 1
-            self.data = np.array([0] * num_neurons + [1])
+            self.data = np.zeros(self.SIZE, dtype = np.float32)
+            self.data[-1] = 1
         else:
             self.SIZE = num_neurons
-            self.data = np.array([0] * num_neurons)
+            self.data = np.zeros(self.SIZE, dtype = np.float32)
 
     def activate(self):
         """
@@ -108,32 +175,253 @@ class Connection:
     The representation of a connection between layers in a neural network.
     """
 
-    def __init__(self, layer_from, layer_to):
+    def __init__(self, layer_from, layer_to, rng = None, weights = None):
         """"
         Creates a 'Connection' between 'layer_from' and 'layer_to' that contains
         all required weights, which are randomly initialized with random numbers
-        in a guassian distribution of mean '0' and standard deviation '1'.
+        from 'rng' in a guassian distribution of mean '0' and standard deviation
+        '1'. If 'weights' is given, it is used as the weights instead (without
+        copying it when possible).
         """
         self.FROM = layer_from
         self.TO = layer_to
-        self.weights = np.zeros((layer_from.SIZE, layer_to.SIZE))
-        for i in range(layer_from.SIZE):
-            for j in range(layer_to.SIZE):
-                self.weights[i][j] = np.random.standard_normal()
+        if weights is not None:
+            assert(np.shape(weights) == (layer_from.SIZE, layer_to.SIZE))
+            self.weights = np.asarray(weights, dtype = np.float32)
+            return
+        if rng is None:
+            rng = np.random
+        self.weights = rng.standard_normal((layer_from.SIZE, layer_to.SIZE)).astype(np.float32)
+
+class BatchedNNetwork:
+    """
+    A batch of neural networks ("genomes") sharing the same shape. Every genome
+    is one row of a contiguous float32 parameter matrix ('params'), laid out
+    like 'NNetwork.params'. 'weights' holds one '(genomes, from, to)' view of
+    it per connection, so that the whole batch is fed forward in a single pass.
+    Genomes are referred to by their row, so many bots can share one genome.
+
+    When every input neuron only takes a few discrete values, the batch can be
+    compiled (see 'compile') into a table holding every genome's action for
+    every possible input, turning 'actions' into a lookup.
+    """
+
+    # Largest number of distinct inputs 'compile' enumerates.
+    MAX_POLICY_INPUTS = 256
+
+    def __init__(self, layer_sizes, activation_funcs, bias_neuron = False):
+        """
+        Creates an empty 'BatchedNNetwork' for networks built with the same
+        arguments as 'NNetwork'.
+        """
+        assert(len(layer_sizes) >= 2)
+        assert(len(layer_sizes) - 1 == len(activation_funcs))
+        assert(min(layer_sizes) >= 1)
+        self.ACTIVATION_FUNCS = tuple(activation_funcs)
+        self.HAS_BIAS_NEURON = bias_neuron
+        sizes = [size + 1 if bias_neuron else size for size in layer_sizes[:-1]] + [layer_sizes[-1]]
+        self.SHAPES = [(sizes[i], sizes[i + 1]) for i in range(len(sizes) - 1)]
+        self.SIZE = sum(rows * cols for rows, cols in self.SHAPES)
+        self.params = np.zeros((0, self.SIZE), dtype = np.float32)
+        self.weights = self.unflatten(self.params)
+        self._buffers = None
+        self.policy = None
+
+    def __len__(self):
+        return len(self.params)
+
+    def append(self, params):
+        """
+        Appends the rows of 'params' as new genomes and returns their rows.
+        """
+        start = len(self.params)
+        self.params = np.concatenate((self.params, np.asarray(params, dtype = np.float32)))
+        self.weights = self.unflatten(self.params)
+        return np.arange(start, len(self.params))
+
+    def append_random(self, n, rng):
+        """
+        Appends 'n' new genomes with weights drawn from 'rng' (like those of a
+        new 'NNetwork', in one draw) and returns their rows.
+        """
+        return self.append(rng.standard_normal((n, self.SIZE)).astype(np.float32))
+
+    def flatten(self, weights):
+        """
+        Flattens stacked weights (one '(n, from, to)' array per connection)
+        into one '(n, parameters)' array holding each network's parameters in a
+        single row.
+        """
+        return np.concatenate([np.asarray(w, dtype = np.float32).reshape(len(w), -1) for w in weights], axis = 1)
+
+    def unflatten(self, params):
+        """
+        Splits the rows of 'params' (as returned by 'flatten') into stacked
+        weights, without copying them.
+        """
+        weights = []
+        start = 0
+        for rows, cols in self.SHAPES:
+            weights.append(params[:, start:start + rows * cols].reshape(len(params), rows, cols))
+            start += rows * cols
+        return weights
+
+    def select(self, keep):
+        """
+        Keeps only the genomes selected by the boolean mask (or indices)
+        'keep'.
+        """
+        if self.policy is not None:
+            self.policy = self._policy_table()[keep]
+        self.params = self.params[keep]
+        self.weights = self.unflatten(self.params)
+
+    def compile(self, values):
+        """
+        Compiles the batch into a table of actions for inputs whose every
+        neuron takes one of 'values'. The actions of a genome are computed the
+        first time it is used after being appended; genomes never change, so
+        they stay valid until the genome is dropped. Returns 'False' (and
+        leaves the batch uncompiled) if there are more than
+        'MAX_POLICY_INPUTS' possible inputs.
+        """
+        values = np.unique(np.asarray(values, dtype = np.float32))
+        num_inputs = self.SHAPES[0][0] - (1 if self.HAS_BIAS_NEURON else 0)
+        if len(values) ** num_inputs > BatchedNNetwork.MAX_POLICY_INPUTS:
+            self.policy = None
+            return False
+        self.POLICY_VALUES = values
+        self.POLICY_INPUTS = np.array(list(itertools.product(values, repeat = num_inputs)), dtype = np.float32).reshape(-1, num_inputs)
+        # Index of an input in 'POLICY_INPUTS' is the dot product of the
+        # indices of its values with these place values.
+        self.POLICY_PLACES = len(values) ** np.arange(num_inputs - 1, -1, -1)
+        self.policy = np.zeros((0, len(self.POLICY_INPUTS)), dtype = np.int8)
+        return True
+
+    def _policy_table(self):
+        """
+        The compiled action table, after computing the actions of the genomes
+        appended since it was last used.
+        """
+        start = len(self.policy)
+        if start < len(self.params):
+            count = len(self.POLICY_INPUTS)
+            genomes = np.repeat(np.arange(start, len(self.params)), count)
+            data = np.tile(self.POLICY_INPUTS, (len(self.params) - start, 1))
+            actions = np.argmax(self.feed_forward(data, genomes), axis = 1).astype(np.int8)
+            self.policy = np.concatenate((self.policy, actions.reshape(-1, count)))
+        return self.policy
+
+    def feed_forward(self, data, genomes = None):
+        """
+        Feeds 'data' through the batch and returns the output layers as an
+        '(N, out)' array. Row 'i' of 'data' is fed through genome 'genomes[i]'
+        ('genomes' defaults to every genome, in order). The returned array is
+        a buffer that is overwritten by the next call.
+        """
+        n = len(self.params) if genomes is None else len(genomes)
+        gathered, layers = self._buffers_for(n)
+        if genomes is None:
+            weights = self.weights
+        else:
+            weights = gathered
+            for w, out in zip(self.weights, gathered):
+                np.take(w, genomes, axis = 0, out = out)
+        data = np.asarray(data).reshape(n, -1)
+        if self.HAS_BIAS_NEURON:
+            layers[0][:, :-1] = data
+        else:
+            layers[0][...] = data
+        for w, activation_func, src, dst in zip(weights, self.ACTIVATION_FUNCS, layers, layers[1:]):
+            np.einsum("ni,nio->no", src, w, out = dst)
+            activation_func(dst)
+        return layers[-1]
+
+    def _buffers_for(self, n):
+        """
+        The gathered weight and layer buffers for a batch of 'n' rows. They
+        are kept between calls and only reallocated when 'n' changes.
+        """
+        if self._buffers is None or len(self._buffers[1][0]) != n:
+            gathered = [np.empty((n, rows, cols), dtype = np.float32) for rows, cols in self.SHAPES]
+            layers = [np.empty((n, self.SHAPES[0][0]), dtype = np.float32)]
+            layers += [np.empty((n, cols), dtype = np.float32) for rows, cols in self.SHAPES]
+            if self.HAS_BIAS_NEURON:
+                layers[0][:, -1] = 1
+            self._buffers = (gathered, layers)
+        return self._buffers
+
+    def actions(self, data, genomes = None):
+        """
+        Feeds 'data' through the batch (see 'feed_forward') and returns the
+        index of the strongest output neuron of each row. If the batch is
+        compiled and every value of 'data' was enumerated, the actions are
+        looked up instead.
+        """
+        if self.policy is not None:
+            n = len(self.params) if genomes is None else len(genomes)
+            data = np.asarray(data, dtype = np.float32).reshape(n, -1)
+            indices = np.minimum(np.searchsorted(self.POLICY_VALUES, data), len(self.POLICY_VALUES) - 1)
+            if (self.POLICY_VALUES[indices] == data).all():
+                rows = np.arange(n) if genomes is None else genomes
+                return self._policy_table()[rows, indices @ self.POLICY_PLACES]
+        return np.argmax(self.feed_forward(data, genomes), axis = 1)
+
+def mutate(genomes, rate, rng):
+    """
+    Returns mutated copies of 'genomes' (one parameter vector per row). Every
+    weight mutates with probability 'rate', but every genome mutates at least
+    once. Mutated weights are scaled by a random factor around '1' and shifted
+    by a random amount.
+    """
+    genomes = np.array(genomes, dtype = np.float32)
+    n, size = genomes.shape
+    if n == 0:
+        return genomes
+
+    # The first mutated weight of every genome is drawn from a geometric
+    # distribution cut off at the genome's size, and the weights after it then
+    # mutate independently. This is the same as drawing mutations for every
+    # weight until at least one happens, without having to retry.
+    never = np.exp(size * np.log1p(-rate))
+    first = np.floor(np.log1p(-rng.uniform(0, 1, n) * (1 - never)) / np.log1p(-rate)).astype(int)
+    first = np.minimum(first, size - 1)
+    mask = (rng.uniform(0, 1, (n, size)) <= rate) & (np.arange(size) > first[:, None])
+    mask[np.arange(n), first] = True
+
+    count = np.count_nonzero(mask)
+    genomes[mask] = genomes[mask] * rng.normal(1, 0.5, count) + rng.standard_normal(count)
+    return genomes
 
 def sigmoid(data):
     """
-    Uses sigmoid transformation on given data. This is an activation function.
+    Uses sigmoid transformation on given data (in place). This is an activation
+    function. It is computed as '(1 + tanh(x / 2)) / 2', which cannot overflow.
     """
-    for i in range(len(data)):
-        data[i] = 1 / (1 + np.exp(-data[i]))
+    data *= 0.5
+    np.tanh(data, out = data)
+    data += 1
+    data *= 0.5
 
 def softmax(data):
     """
-    Uses softmax transformation on given data. This is an activation function.
+    Uses softmax transformation on given data (in place, along the last axis).
+    This is an activation function. The maximum is subtracted first, so large
+    inputs do not overflow.
     """
-    sum = 0.0
-    for i in range(len(data)):
-        sum += np.exp(data[i])
-    for i in range(len(data)):
-        data[i] = np.exp(data[i]) / sum
+    if data.ndim == 1:
+        data -= data.max()
+        np.exp(data, out = data)
+        data /= data.sum()
+        return
+    # Reductions along a short last axis are slow in numpy, so the maximum and
+    # the sum of every row are accumulated one column at a time instead.
+    acc = data[..., 0].copy()
+    for k in range(1, data.shape[-1]):
+        np.maximum(acc, data[..., k], out = acc)
+    data -= acc[..., None]
+    np.exp(data, out = data)
+    acc[...] = data[..., 0]
+    for k in range(1, data.shape[-1]):
+        acc += data[..., k]
+    data /= acc[..., None]
@@ -0,0 +1,105 @@
+"""
+This module implements the pool that stores the state of a population's
+entities.
+"""
+
+import numpy as np
+
+class EntityPool:
+    """
+    Per-entity state stored column by column in arrays with spare capacity at
+    the end, so that spawning entities costs time proportional to their number
+    rather than to the size of the pool. Every entity gets an integer id that
+    never changes and is never reused. Removing an entity only marks it dead;
+    dead entities are dropped all at once by 'compact' (once per tick). The
+    entities stay in the order they were spawned in, so ids are sorted and are
+    looked up by binary search. 'columns' maps every column name to its
+    entries for every entity (views, valid until the next 'spawn' or
+    'compact').
+    """
+
+    def __init__(self, columns, capacity = 64):
+        """
+        Creates an empty 'EntityPool' with the given columns (a dictionary
+        mapping names to the dtype and shape of one entry), plus the 'id' and
+        'alive' columns, with room for 'capacity' entities.
+        """
+        assert(capacity >= 1)
+        self.COLUMNS = dict(columns, id = (np.int64, ()), alive = (bool, ()))
+        self.count = 0
+        self.next_id = 0
+        self._arrays = {name: np.zeros((capacity,) + shape, dtype = dtype) for name, (dtype, shape) in self.COLUMNS.items()}
+        self._resize(0)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def capacity(self):
+        return len(self._arrays["id"])
+
+    def spawn(self, n, **values):
+        """
+        Appends 'n' living entities, setting the columns given in 'values' (the
+        others are zeroed), and returns their indices.
+        """
+        if self.count + n > self.capacity:
+            self._reserve(max(self.count + n, 2 * self.capacity))
+        new = slice(self.count, self.count + n)
+        for name, array in self._arrays.items():
+            array[new] = values.get(name, 0)
+        self._arrays["id"][new] = np.arange(self.next_id, self.next_id + n)
+        self._arrays["alive"][new] = True
+        self.next_id += n
+        self._resize(self.count + n)
+        return np.arange(new.start, new.stop)
+
+    def remove(self, indices):
+        """
+        Marks the entities at 'indices' dead. They keep their place (and
+        index) until 'compact' is called.
+        """
+        self._arrays["alive"][indices] = False
+
+    def compact(self):
+        """
+        Drops the dead entities, keeping the others in order. Returns the mask
+        of the entities kept, or 'None' if none were dead.
+        """
+        keep = self.columns["alive"]
+        if keep.all():
+            return None
+        keep = keep.copy()
+        n = np.count_nonzero(keep)
+        for array in self._arrays.values():
+            array[:n] = array[:self.count][keep]
+        self._resize(n)
+        return keep
+
+    def index_of(self, ids):
+        """
+        The indices of the living entities with the ids 'ids' ('-1' for ids of
+        entities that are dead or gone).
+        """
+        ids = np.asarray(ids, dtype = np.int64)
+        if self.count == 0:
+            return np.full(ids.shape, -1)
+        indices = np.minimum(np.searchsorted(self.columns["id"], ids), self.count - 1)
+        found = (self.columns["id"][indices] == ids) & self.columns["alive"][indices]
+        return np.where(found, indices, -1)
+
+    def _resize(self, count):
+        """
+        Sets the number of entities and updates the views of the columns.
+        """
+        self.count = count
+        self.columns = {name: array[:count] for name, array in self._arrays.items()}
+
+    def _reserve(self, capacity):
+        """
+        Moves the columns into arrays with room for 'capacity' entities.
+        """
+        for name, array in self._arrays.items():
+            grown = np.zeros((capacity,) + array.shape[1:], dtype = array.dtype)
+            grown[:self.count] = array[:self.count]
+            self._arrays[name] = grown
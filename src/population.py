@@ -3,127 +3,479 @@ This modules implements the bulk of Bot Evolution.
 """
 
 import numpy as np
-import copy
 import settings
-from utility import seq_is_equal, distance_between, angle_is_between, find_angle
-from neural_network import NNetwork, sigmoid, softmax
+from utility import squared_distance, in_field_of_vision, vision_mask
+from neural_network import NNetwork, BatchedNNetwork, sigmoid, softmax, mutate
+from spatial import UniformGrid
+from rng import RandomStreams
+from world import World
+from pool import EntityPool
+import telemetry
+import history
+
+def _bot_column(name):
+    """
+    A read-only attribute for column 'name' of a population's bot pool.
+    """
+    return property(lambda self: self._bots.columns[name])
 
 class Population:
     """
-    The environment of bots and food.
+    The environment of bots and food. The state of every bot and food item is
+    stored in contiguous arrays (one entry per entity) so that the per-tick
+    logic can be applied to the whole population at once. Bots live in an
+    'EntityPool', which gives each of them a stable id. 'Bot' and 'Food'
+    objects are thin views into these arrays.
     """
 
-    def __init__(self, size, mutation_rate):
+    # The state of every bot (see '_clear').
+    x = _bot_column("x")
+    y = _bot_column("y")
+    theta = _bot_column("theta")
+    score = _bot_column("score")
+    rgb = _bot_column("rgb")
+    genome = _bot_column("genome")
+    alive = _bot_column("alive")
+    id = _bot_column("id")
+
+    # The neural network will have 1 neuron in the input layer, 1 hidden layer
+    # with 2 neurons, and 4 neurons in the output layer. The sigmoid activation
+    # function will be used on the hidden layer, and a softmax activation
+    # function will be used on the output layer. Input consists of the bot's
+    # direction and if there is or isn't food in the bots field of vision.
+    # Output consists of whether or not to move foward, turn left, turn right,
+    # or do nothing. A population's input layer is sized for the sensors of
+    # its world instead (see 'World.INPUTS'), and its hidden layers may be
+    # sized differently (see 'network_shape').
+    LAYER_SIZES = (1, 2, 4)
+    ACTIVATION_FUNCS = (sigmoid, softmax)
+
+    # Values the input neuron takes (no food in sight, food in sight). The
+    # networks are compiled into a table of actions for these inputs (only
+    # with the field-of-vision sensor, as ray distances take any value).
+    INPUT_VALUES = (0.0, 1.0)
+
+    # In pixels/radians. Size of the grid cells used to look up food in a bot's
+    # field of vision, and how much wider than the field of vision the looked
+    # up cells reach (to cover the rounding to whole degrees done by
+    # 'find_angle' and 'angle_is_between').
+    VISION_CELL_SIZE = 64
+    VISION_MARGIN = 2 * np.pi / 180
+
+    # Culling grid cells costs about as much as testing ten food items, so
+    # cells are only culled when they hold more food than that on average.
+    # Bots are tested in batches of about 'VISION_BATCH' bot/food pairs.
+    VISION_CULL_OCCUPANCY = 10
+    VISION_BATCH = 2 ** 18
+
+    def __init__(self, size, mutation_rate, seed = None, world = None, hidden = None):
+        """
+        Creates a 'Population' of 'size' random bots in 'world' (a 'World', by
+        default one with a single food item and a field-of-vision sensor)
+        whose networks have hidden layers of the sizes in 'hidden' (by
+        default those of 'LAYER_SIZES'). All randomness is drawn from streams
+        derived from 'seed' (see 'RandomStreams').
+        """
         assert(size >= 5)
         assert(0 < mutation_rate < 1)
         self.SIZE = size
         self.mutation_rate = mutation_rate
-        self.bots = []
-        self.food = []
         self.time_since_last_death = 0.0
+        self.rng = RandomStreams(seed)
+        self.telemetry = telemetry.DISABLED
+        self.history = history.DISABLED
+        self._set_world(world, hidden)
+        self._clear()
+        self._spawn_random_bots(size)
+        self.food_x, self.food_y = _random_food_positions(self.rng.food, self.world.FOOD, self.world.FOOD_REGION)
+
+    @classmethod
+    def from_arrays(cls, size, mutation_rate, x, y, theta, score, rgb, genomes, genome, food_x, food_y, seed = None, world = None, hidden = None):
+        """
+        Creates a 'Population' from existing bot and food state instead of
+        random bots. 'genomes' holds the parameter vectors of the neural
+        networks (one per row, see 'BatchedNNetwork') and 'genome' the row used
+        by every bot.
+        """
+        assert(size >= 5)
+        assert(0 < mutation_rate < 1)
+        pop = cls.__new__(cls)
+        pop.SIZE = size
+        pop.mutation_rate = mutation_rate
+        pop.time_since_last_death = 0.0
+        pop.rng = RandomStreams(seed)
+        pop.telemetry = telemetry.DISABLED
+        pop.history = history.DISABLED
+        pop._set_world(world, hidden)
+        pop._clear()
+        pop._spawn_bots(pop.nnet_batch.append(genomes)[genome], rgb, x, y, theta)
+        pop.score[:] = score
+        pop.food_x = np.array(food_x, dtype = float)
+        pop.food_y = np.array(food_y, dtype = float)
+        return pop
+
+    def _set_world(self, world, hidden = None):
+        """
+        Sets the population's world and the shape of its networks (see
+        'network_shape').
+        """
+        self.world = World() if world is None else world
+        self.HIDDEN = tuple(Population.LAYER_SIZES[1:-1]) if hidden is None else tuple(int(n) for n in hidden)
+        self.LAYER_SIZES, self.ACTIVATION_FUNCS = Population.network_shape(self.world, self.HIDDEN)
+
+    @staticmethod
+    def network_shape(world, hidden):
+        """
+        The layer sizes and activation functions of the networks of a
+        population in 'world' with hidden layers of the sizes in 'hidden'. The
+        input layer is sized for the world's sensors, every hidden layer uses
+        the sigmoid function and the output layer the softmax function.
+        """
+        assert(all(n >= 1 for n in hidden))
+        return (world.INPUTS,) + tuple(hidden) + (Population.LAYER_SIZES[-1],), (sigmoid,) * len(hidden) + (softmax,)
+
+    def _clear(self):
+        """
+        Removes every bot and food item.
+        """
+        # Bot state. A bot whose 'alive' entry is 'False' has been eliminated
+        # and is dropped from the arrays at the end of the current tick. Every
+        # bot refers to a genome (a row of 'nnet_batch') which it may share
+        # with other bots. Genomes are never changed, and are dropped once no
+        # bot refers to them.
+        self._bots = EntityPool({
+            "x": (np.float64, ()),
+            "y": (np.float64, ()),
+            "theta": (np.float64, ()),
+            "score": (np.float64, ()),
+            "rgb": (np.uint8, (3,)),
+            "genome": (np.int32, ()),
+        }, 2 * self.SIZE)
+
+        # Neural networks.
+        self.nnet_batch = BatchedNNetwork(self.LAYER_SIZES, self.ACTIVATION_FUNCS)
+        if self.world.RAYS == 0:
+            self.nnet_batch.compile(Population.INPUT_VALUES)
+
+        # Food state.
+        self.food_x = np.zeros(0)
+        self.food_y = np.zeros(0)
 
-        # The neural network will have 1 neuron in the input layer, 1 hidden
-        # layer with 2 neurons, and 4 neurons in the output layer. The sigmoid
-        # activation function will be used on the hidden layer, and a softmax
-        # activation function will be used on the output layer. Input consists
-        # of the bot's direction and if there is or isn't food in the bots field
-        # of vision. Output consists of whether or not to move foward, turn
-        # left, turn right, or do nothing.
-        for i in range(size):
-            random_rgb = (np.random.randint(30, 256), np.random.randint(30, 256), np.random.randint(30, 256))
-            self.bots.append(Bot(NNetwork((1, 2, 4), (sigmoid, softmax)), random_rgb, self))
-        self.food.append(Food(self))
+    @property
+    def bots(self):
+        """
+        Views of every living bot.
+        """
+        return [Bot(self, i) for i in np.flatnonzero(self.alive)]
+
+    @property
+    def food(self):
+        """
+        Views of every food item.
+        """
+        return [Food(self, i) for i in range(len(self.food_x))]
+
+    def _spawn_bots(self, genome, rgb, x = None, y = None, theta = None):
+        """
+        Appends a bot for every genome (row of 'nnet_batch') in 'genome'.
+        Unless provided, bots are given a random heading and a random position
+        within the spawn radius of the middle of the map.
+        """
+        n = len(rgb)
+        if theta is None:
+            theta = self.rng.spawning.uniform(0, 1, n) * 2 * np.pi
+        if x is None:
+            x = settings.WINDOW_WIDTH / 2.0 + Bot.SPAWN_RADIUS * self.rng.spawning.uniform(0, 1, n) * np.cos(theta)
+        if y is None:
+            y = settings.WINDOW_HEIGHT / 2.0 + Bot.SPAWN_RADIUS * self.rng.spawning.uniform(0, 1, n) * np.sin(theta)
+        self._bots.spawn(n, x = x, y = y, theta = theta, rgb = np.asarray(rgb, dtype = np.uint8).reshape(n, 3), genome = genome)
+
+    def _spawn_random_bots(self, n):
+        """
+        Appends 'n' bots with a random color and a randomly initialized neural
+        network. The weights of all 'n' networks are drawn at once.
+        """
+        self._spawn_bots(self.nnet_batch.append_random(n, self.rng.weights), self.rng.spawning.integers(30, 256, (n, 3)))
+
+    def _compact(self):
+        """
+        Drops eliminated bots, and the genomes no bot refers to anymore, from
+        the arrays.
+        """
+        self._bots.compact()
+        used = np.zeros(len(self.nnet_batch), dtype = bool)
+        used[self.genome] = True
+        if not used.all():
+            self.nnet_batch.select(used)
+            self.genome[:] = (np.cumsum(used) - 1).astype(np.int32)[self.genome]
+
+    def index_of(self, ids):
+        """
+        The current indices of the living bots with the ids 'ids' ('-1' for
+        bots that were eliminated).
+        """
+        return self._bots.index_of(ids)
+
+    def _weakest(self, n = 1):
+        """
+        Indices of the 'n' living bots with the lowest score, in ascending
+        order. Of bots tied on score, the earliest spawned (lowest index) are
+        taken first, as 'argpartition' alone breaks ties differently across
+        machines.
+        """
+        n = min(n, np.count_nonzero(self.alive))
+        if n == 0:
+            return np.zeros(0, dtype = int)
+        score = np.where(self.alive, self.score, np.inf)
+        cutoff = score[np.argpartition(score, n - 1)[n - 1]]
+        below = np.flatnonzero(score < cutoff)
+        return np.sort(np.concatenate((below, np.flatnonzero(score == cutoff)[:n - len(below)])))
+
+    def best(self, n):
+        """
+        Indices of the 'n' living bots with the highest score, best first.
+        """
+        order = np.argsort(np.where(self.alive, -self.score, np.inf), kind = "stable")
+        return order[:min(n, np.count_nonzero(self.alive))]
+
+    def export_bots(self, bots):
+        """
+        The genomes of the bots at indices 'bots': the weights of each
+        connection stacked into one '(n, from, to)' array, and their colors.
+        """
+        return self.nnet_batch.unflatten(self.nnet_batch.params[self.genome[bots]]), self.rgb[bots]
+
+    def import_bots(self, weights, rgb):
+        """
+        Replaces the weakest bots with bots built from genomes exported by
+        'export_bots' (possibly from another population).
+        """
+        self.eliminate(self._weakest(len(rgb)))
+        self._spawn_bots(self.nnet_batch.append(self.nnet_batch.flatten(weights)), rgb)
+        self._compact()
+
+    def place_food(self, x, y):
+        """
+        Moves the most recently spawned food item to ('x', 'y').
+        """
+        self.food_x[-1] = x
+        self.food_y[-1] = y
 
     def eliminate(self, bot, replace = False):
+        """
+        Eliminates the bot(s) at index (or array of indices) 'bot', optionally
+        replacing each with a completely random bot.
+        """
         self.time_since_last_death = 0.0
-        self.bots.remove(bot)
+        self._bots.remove(bot)
+        self.telemetry.count("deaths", np.size(bot))
         if replace:
-            random_rgb = (np.random.randint(30, 256), np.random.randint(30, 256), np.random.randint(30, 256))
-            self.bots.append(Bot(NNetwork((1, 2, 4), (sigmoid, softmax)), random_rgb, self))
+            self._spawn_random_bots(np.size(bot))
+            self.telemetry.count("replacements", np.size(bot))
 
     def feed(self, bot, food):
-        bot.score = 1.0
-        self.food.remove(food)
-        self.food.append(Food(self))
-        num_to_replace = int(self.SIZE / 7 - 1)
-        if num_to_replace < 2:
-            num_to_replace = 2
-        for i in range(num_to_replace):
-            weakest = self.bots[0]
-            for other in self.bots:
-                if other.score < weakest.score:
-                    weakest = other
-            self.eliminate(weakest)
-        for i in range(num_to_replace):
-            if np.random.uniform(0, 1) <= self.mutation_rate:
-                new_rgb = [bot.RGB[0], bot.RGB[1], bot.RGB[2]]
-                new_rgb[np.random.choice((0, 1, 2))] = np.random.uniform(30, 256)
-                new_bot = Bot(bot.nnet, new_rgb, self)
-                new_bot.x = bot.x + Bot.HITBOX_RADIUS * 4 * np.random.uniform(0, 1) * np.random.choice((-1, 1))
-                new_bot.y = bot.y + Bot.HITBOX_RADIUS * 4 * np.random.uniform(0, 1) * np.random.choice((-1, 1))
-                nb_c = new_bot.nnet.connections
-                mutated = False
-                while not mutated:
-                    for k in range(len(nb_c)):
-                        for i in range(nb_c[k].FROM.SIZE):
-                            for j in range(nb_c[k].TO.SIZE):
-                                if np.random.uniform(0, 1) <= self.mutation_rate:
-                                    nb_c[k].weights[i][j] = nb_c[k].weights[i][j] * np.random.normal(1, 0.5) + np.random.standard_normal()
-                                    mutated = True
-                self.bots.append(new_bot)
+        """
+        Bot 'bot' eats food item 'food' (both indices). The food is moved
+        elsewhere, the weakest bots are culled and the bot reproduces in their
+        place.
+        """
+        with self.telemetry.phase("reproduction"):
+            self.score[bot] = 1.0
+            x, y = _random_food_positions(self.rng.food, 1, self.world.FOOD_REGION)
+            self.food_x[food] = x[0]
+            self.food_y[food] = y[0]
+            num_to_replace = int(self.SIZE / 7 - 1)
+            if num_to_replace < 2:
+                num_to_replace = 2
+            self.eliminate(self._weakest(num_to_replace))
+
+            # Children share the bot's genome and color. Some of them mutate:
+            # one of their color channels is redrawn and they get a new genome
+            # with some of the weights perturbed.
+            children_genome = np.repeat(self.genome[bot], num_to_replace)
+            children_rgb = np.repeat(self.rgb[bot:bot + 1], num_to_replace, axis = 0)
+            mutated = np.flatnonzero(self.rng.mutation.uniform(0, 1, num_to_replace) <= self.mutation_rate)
+            children_rgb[mutated, self.rng.mutation.integers(0, 3, len(mutated))] = self.rng.mutation.uniform(30, 256, len(mutated))
+            parent = self.nnet_batch.params[self.genome[bot]]
+            children_genome[mutated] = self.nnet_batch.append(mutate(np.repeat(parent[None, :], len(mutated), axis = 0), self.mutation_rate, self.rng.mutation))
+            x = self.x[bot] + Bot.HITBOX_RADIUS * 4 * self.rng.spawning.uniform(0, 1, num_to_replace) * self.rng.spawning.choice((-1, 1), num_to_replace)
+            y = self.y[bot] + Bot.HITBOX_RADIUS * 4 * self.rng.spawning.uniform(0, 1, num_to_replace) * self.rng.spawning.choice((-1, 1), num_to_replace)
+            self._spawn_bots(children_genome, children_rgb, x, y)
+            children = np.arange(len(self.x) - num_to_replace, len(self.x))
+            self.history.feed(self, bot, children, children[mutated])
+            self.telemetry.count("feeds")
+            self.telemetry.count("mutations", len(mutated))
+
+    def _sense(self, active):
+        """
+        The input of the sensors of every bot at the indices 'active', as an
+        '(n, inputs)' array.
+        """
+        if self.world.RAYS > 0:
+            return self._rays(active)
+        return self._vision(active)[:, None]
+
+    def _rays(self, active):
+        """
+        For every bot at the indices 'active' and every ray of its sensors,
+        the distance along the ray to the nearest food item it hits, as a
+        fraction of the ray length ('1.0' if it hits none). Only food within
+        reach of the bot's fan of rays is tested, against all of its rays at
+        once, in batches of about 'VISION_BATCH' bot/food pairs.
+        """
+        RAY_LENGTH = self.world.RAY_LENGTH
+        angles = self.world.ray_angles()
+        distance = np.ones((len(active), len(angles)))
+        if len(self.food_x) == 0:
+            return distance
+        R2 = Food.HITBOX_RADIUS * Food.HITBOX_RADIUS
+        REACH = RAY_LENGTH + Food.HITBOX_RADIUS
+        HALF_SPREAD = self.world.RAY_SPREAD / 2
+        batch = max(Population.VISION_BATCH // len(self.food_x), 1)
+        for start in range(0, len(active), batch):
+            bots = active[start:start + batch]
+            dx = self.food_x[None, :] - self.x[bots, None]
+            dy = self.food_y[None, :] - self.y[bots, None]
+            d2 = dx * dx + dy * dy
+            viewer, target = np.nonzero(d2 <= REACH * REACH)
+            dx = dx[viewer, target]
+            dy = dy[viewer, target]
+            d2 = d2[viewer, target]
+            if HALF_SPREAD <= np.pi / 2:
+                # The center of an item a ray can hit lies at most the item's
+                # angular radius outside the fan of rays: its distance ahead
+                # is at least 'cos(HALF_SPREAD + asin(r / d)) * d'.
+                theta = self.theta[bots[viewer]]
+                ahead = np.cos(theta) * dx - np.sin(theta) * dy
+                keep = (ahead >= np.cos(HALF_SPREAD) * np.sqrt(np.maximum(d2 - R2, 0)) - np.sin(HALF_SPREAD) * Food.HITBOX_RADIUS) | (d2 <= R2)
+                viewer, dx, dy, d2 = viewer[keep], dx[keep], dy[keep], d2[keep]
+            if len(viewer) == 0:
+                continue
+            dx = dx[:, None]
+            dy = dy[:, None]
+            d2 = d2[:, None]
+            # Directions of the rays (y grows downwards on screen) and how far
+            # along every ray each food item's center lies.
+            heading = self.theta[bots, None] + angles
+            t = np.cos(heading)[viewer] * dx - np.sin(heading)[viewer] * dy
+            # A ray hits a food item if it passes within the item's radius of
+            # its center, ahead of the bot (or starts inside the item). It
+            # enters the item half a chord before the center's projection.
+            half_chord2 = R2 - (d2 - t * t)
+            hit = (half_chord2 >= 0) & ((t >= 0) | (d2 <= R2))
+            along = np.where(hit, t - np.sqrt(np.maximum(half_chord2, 0)), np.inf)
+            np.maximum(along, 0, out = along)
+            # Pairs come grouped by bot, so the nearest hit of each of a bot's
+            # rays is the minimum over its group.
+            first = np.flatnonzero(np.concatenate(([True], viewer[1:] != viewer[:-1])))
+            nearest = np.minimum.reduceat(along, first, axis = 0)
+            distance[start + viewer[first]] = np.minimum(nearest / RAY_LENGTH, 1.0)
+        return distance
+
+    def _vision(self, active):
+        """
+        For every bot at the indices 'active', '1.0' if there is food in its
+        field of vision and '0.0' otherwise. If the food is dense enough, only
+        food in grid cells overlapping a bot's field of vision is tested.
+        """
+        sensory_input = np.zeros(len(active))
+        if len(self.food_x) == 0:
+            return sensory_input
+        food_grid = UniformGrid(Population.VISION_CELL_SIZE)
+        food_grid.build(self.food_x, self.food_y)
+        cull = len(self.food_x) > Population.VISION_CULL_OCCUPANCY * len(food_grid)
+        batch = max(Population.VISION_BATCH // len(self.food_x), 1)
+        for start in range(0, len(active), batch):
+            bots = active[start:start + batch]
+            if cull:
+                in_view = food_grid.cells_in_view(self.x[bots], self.y[bots], self.theta[bots], Bot.FIELD_OF_VISION_THETA / 2 + Population.VISION_MARGIN)
+                viewer, target = np.nonzero(in_view[:, food_grid.cell])
+                seen = in_field_of_vision(self.x[bots[viewer]], self.y[bots[viewer]], self.theta[bots[viewer]], Bot.FIELD_OF_VISION_THETA,
+                    self.food_x[target], self.food_y[target], self.world.QUANTIZED_VISION)
+                sensory_input[start + viewer[seen]] = 1.0
             else:
-                new_bot = Bot(bot.nnet, bot.RGB, self)
-                new_bot.x = bot.x + Bot.HITBOX_RADIUS * 4 * np.random.uniform(0, 1) * np.random.choice((-1, 1))
-                new_bot.y = bot.y + Bot.HITBOX_RADIUS * 4 * np.random.uniform(0, 1) * np.random.choice((-1, 1))
-                self.bots.append(new_bot)
+                seen = vision_mask(self.x[bots], self.y[bots], self.theta[bots], Bot.FIELD_OF_VISION_THETA,
+                    self.food_x, self.food_y, self.world.QUANTIZED_VISION)
+                sensory_input[start:start + len(bots)] = seen.any(axis = 1)
+        return sensory_input
 
     def update(self, dt):
         """
         Updates the population's internals. The bulk of event handling for all
         bots and food starts here.
         """
-        self.time_since_last_death += 1.0 / settings.FPS * dt * settings.TIME_MULTIPLIER
+        step = 1.0 / settings.FPS * dt * settings.TIME_MULTIPLIER
+        self.time_since_last_death += step
 
-        for food in self.food[:]:
-            if food not in self.food:
-                continue
-            food.update(dt)
+        # Bot<->food collision. The first bot touching a food item eats it.
+        # Only bots in grid cells near the food item are tested.
+        with self.telemetry.phase("collisions"):
+            REACH = Bot.HITBOX_RADIUS + Food.HITBOX_RADIUS
+            bot_grid = UniformGrid(REACH)
+            bot_grid.build(self.x, self.y)
+            # Food items with no bot in a neighboring cell are skipped. Feeding
+            # moves bots, so the remaining items are checked again after it.
+            i = 0
+            while i < len(self.food_x):
+                candidates = i + np.flatnonzero(bot_grid.occupied_near(self.food_x[i:], self.food_y[i:], REACH))
+                i = len(self.food_x)
+                for j in candidates:
+                    near = bot_grid.near(self.food_x[j], self.food_y[j], REACH)
+                    touching = near[self.alive[near] & (squared_distance(self.food_x[j], self.food_y[j], self.x[near], self.y[near]) <= REACH * REACH)]
+                    if len(touching) > 0:
+                        self.feed(touching[0], j)
+                        bot_grid.build(self.x, self.y)
+                        i = j + 1
+                        break
 
-        for bot in self.bots[:]:
-            if bot not in self.bots:
-                continue
+        # Only bots alive at this point act during this tick.
+        active = np.flatnonzero(self.alive)
 
-            sensory_input = []
-
-            # This is where the bot's field of vision is put into action.
-            min_theta = bot.theta - Bot.FIELD_OF_VISION_THETA / 2
-            max_theta = bot.theta + Bot.FIELD_OF_VISION_THETA / 2
-            food_in_sight = False
-            for food in self.food:
-                if angle_is_between(find_angle(bot.x, bot.y, food.x, food.y), min_theta, max_theta):
-                    food_in_sight = True
-                    break
-            if food_in_sight:
-                sensory_input.append(1.0)
-            else:
-                sensory_input.append(0.0)
+        # This is where the bot's field of vision is put into action.
+        with self.telemetry.phase("sensing"):
+            sensory_input = self._sense(active)
+
+        # Every bot's action is looked up in its genome's compiled action table
+        # (see 'BatchedNNetwork.compile').
+        with self.telemetry.phase("inference"):
+            all_input = np.zeros((len(self.alive), sensory_input.shape[1]))
+            all_input[active] = sensory_input
+            actions = self.nnet_batch.actions(all_input, self.genome)[active]
+        self.history.actions(actions)
+
+        with self.telemetry.phase("movement"):
+            # "Hunger" can be thought of as a score between '-1' and '1' where
+            # a greater value means less hungry.
+            self.score[active] = np.maximum(self.score[active] - step / 10.0, -1.0)
 
-            # Useful debugging outputs.
-            #print(bot.RGB)
-            #print(sensory_input)
+            forward = active[actions == Bot.MOVE_FORWARD]
+            left = active[actions == Bot.TURN_LEFT]
+            right = active[actions == Bot.TURN_RIGHT]
+            self.x[forward] += Bot.SPEED * step * np.cos(self.theta[forward])
+            self.y[forward] -= Bot.SPEED * step * np.sin(self.theta[forward])
+            self.theta[left] = np.mod(self.theta[left] + Bot.TURN_RATE * step, 2 * np.pi)
+            self.theta[right] = np.mod(self.theta[right] - Bot.TURN_RATE * step, 2 * np.pi)
 
-            bot.update(dt, sensory_input)
+            # Bots that wander too far out of the map die.
+            MARGIN = Bot.HITBOX_RADIUS * 6
+            out_of_bounds = (self.x[forward] < -MARGIN) | (self.x[forward] > settings.WINDOW_WIDTH + MARGIN) \
+                          | (self.y[forward] < -MARGIN) | (self.y[forward] > settings.WINDOW_HEIGHT + MARGIN)
+            if out_of_bounds.any():
+                self.eliminate(forward[out_of_bounds], replace = True)
 
-        if self.time_since_last_death >= 5:
-            weakest = self.bots[0]
-            for bot in self.bots:
-                if bot.score < weakest.score:
-                    weakest = bot
-            self.eliminate(weakest, replace = True)
+            if self.time_since_last_death >= 5:
+                self.eliminate(self._weakest(), replace = True)
+
+        with self.telemetry.phase("compaction"):
+            self._compact()
+        self.telemetry.tick()
+        self.history.tick(self, step)
 
 class Bot:
     """
-    The representation of the circle thing with probes.
+    The representation of the circle thing with probes. A 'Bot' is a view of
+    one entry in its population's arrays. It follows the bot by id, so it
+    stays valid as other bots are dropped and the bot's index changes.
     """
 
     # In pixels/pixels per second/revolutions per second/radians.
@@ -133,80 +485,116 @@ class Bot:
     TURN_RATE = 2 * np.pi
     FIELD_OF_VISION_THETA = 45 * np.pi / 180
 
-    # These lists represent the output from the neural network. Note that the
-    # output '[0, 0, 0, 1]' means "do nothing".
-    MOVE_FORWARD =  [1, 0, 0, 0]
-    TURN_LEFT =     [0, 1, 0, 0]
-    TURN_RIGHT =    [0, 0, 1, 0]
+    # These indices represent the output neuron chosen by the neural network.
+    # Note that the last output neuron means "do nothing".
+    MOVE_FORWARD = 0
+    TURN_LEFT = 1
+    TURN_RIGHT = 2
+    DO_NOTHING = 3
 
-    def __init__(self, nnet, rgb, population):
-        self.nnet = copy.deepcopy(nnet)
-        self.RGB = rgb
+    def __init__(self, population, index):
         self.pop = population
-        self.theta = np.random.uniform(0, 1) * 2 * np.pi
-        self.x = settings.WINDOW_WIDTH / 2.0 + Bot.SPAWN_RADIUS * np.random.uniform(0, 1) * np.cos(self.theta)
-        self.y = settings.WINDOW_HEIGHT / 2.0 + Bot.SPAWN_RADIUS * np.random.uniform(0, 1) * np.sin(self.theta)
-        self.score = 0.0
-
-    def _move_forward(self, dt):
-        self.x += Bot.SPEED / settings.FPS * dt * np.cos(self.theta) * settings.TIME_MULTIPLIER
-        self.y -= Bot.SPEED / settings.FPS * dt * np.sin(self.theta) * settings.TIME_MULTIPLIER
-        if self.x < -Bot.HITBOX_RADIUS * 6 or self.x > settings.WINDOW_WIDTH + Bot.HITBOX_RADIUS * 6 \
-        or self.y < -Bot.HITBOX_RADIUS * 6 or self.y > settings.WINDOW_HEIGHT + Bot.HITBOX_RADIUS * 6:
-            self.pop.eliminate(self, replace = True)
-
-    def _turn_left(self, dt):
-        self.theta += Bot.TURN_RATE / settings.FPS * dt * settings.TIME_MULTIPLIER
-        while self.theta >= 2 * np.pi:
-            self.theta -= 2 * np.pi
-
-    def _turn_right(self, dt):
-        self.theta -= Bot.TURN_RATE / settings.FPS * dt * settings.TIME_MULTIPLIER
-        while self.theta < 0:
-            self.theta += 2 * np.pi
-
-    def update(self, dt, sensory_input):
-        """
-        Updates the bot's internals. "Hunger" can be thought of as a score
-        between '-1' and '1' where a greater value means less hungry.
-        """
-        self.score -= 1.0 / settings.FPS / 10.0 * dt * settings.TIME_MULTIPLIER
-        if self.score < -1:
-            self.score = -1.0
-        self.nnet.feed_forward(sensory_input)
-        output = self.nnet.output()
-        if seq_is_equal(output, Bot.MOVE_FORWARD):
-            self._move_forward(dt)
-        elif seq_is_equal(output, Bot.TURN_LEFT):
-            self._turn_left(dt)
-        elif seq_is_equal(output, Bot.TURN_RIGHT):
-            self._turn_right(dt)
+        self.id = int(population.id[index])
+
+    @property
+    def index(self):
+        """
+        The bot's current index in its population's arrays.
+        """
+        index = int(self.pop.index_of(self.id))
+        if index < 0:
+            raise LookupError("bot %d was eliminated" % self.id)
+        return index
+
+    @property
+    def x(self):
+        return self.pop.x[self.index]
+
+    @x.setter
+    def x(self, value):
+        self.pop.x[self.index] = value
+
+    @property
+    def y(self):
+        return self.pop.y[self.index]
+
+    @y.setter
+    def y(self, value):
+        self.pop.y[self.index] = value
+
+    @property
+    def theta(self):
+        return self.pop.theta[self.index]
+
+    @theta.setter
+    def theta(self, value):
+        self.pop.theta[self.index] = value
+
+    @property
+    def score(self):
+        return self.pop.score[self.index]
+
+    @score.setter
+    def score(self, value):
+        self.pop.score[self.index] = value
+
+    @property
+    def RGB(self):
+        return tuple(int(c) for c in self.pop.rgb[self.index])
+
+    @property
+    def nnet(self):
+        """
+        The bot's neural network. It shares the bot's genome, which is
+        read-only.
+        """
+        return NNetwork(self.pop.LAYER_SIZES, self.pop.ACTIVATION_FUNCS, params = self.pop.nnet_batch.params[self.pop.genome[self.index]])
 
 class Food:
     """
-    The representation of the red circles.
+    The representation of the red circles. A 'Food' is a view of one entry in
+    its population's arrays.
     """
 
     # In pixels.
     HITBOX_RADIUS = 5
     RGB = (255, 0, 0)
 
-    def __init__(self, population):
-        mid_x = int(settings.WINDOW_WIDTH / 2)
-        mid_y = int(settings.WINDOW_HEIGHT / 2)
-        max_left_x = mid_x - (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
-        min_right_x = mid_x + (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
-        max_top_y = mid_y - (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
-        min_bottom_y = mid_y + (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
-        self.x = np.random.choice((np.random.uniform(0, max_left_x), np.random.uniform(min_right_x, settings.WINDOW_WIDTH)))
-        self.y = np.random.choice((np.random.uniform(0, max_top_y), np.random.uniform(min_bottom_y, settings.WINDOW_HEIGHT)))
+    def __init__(self, population, index):
         self.pop = population
+        self.index = index
 
-    def update(self, dt):
-        """
-        Updates the food's internals and handles bot<->food collision.
-        """
-        for bot in self.pop.bots:
-            if distance_between(self.x, self.y, bot.x, bot.y) <= Bot.HITBOX_RADIUS + Food.HITBOX_RADIUS:
-                self.pop.feed(bot, self)
-                break
+    @property
+    def x(self):
+        return self.pop.food_x[self.index]
+
+    @x.setter
+    def x(self, value):
+        self.pop.food_x[self.index] = value
+
+    @property
+    def y(self):
+        return self.pop.food_y[self.index]
+
+    @y.setter
+    def y(self, value):
+        self.pop.food_y[self.index] = value
+
+def _random_food_positions(rng, n, region = None):
+    """
+    Random positions (drawn from 'rng') for 'n' food items, uniformly within
+    'region' (a '(left, top, right, bottom)' rectangle) or, by default, away
+    from where bots spawn.
+    """
+    if region is not None:
+        left, top, right, bottom = region
+        return rng.uniform(left, right, n), rng.uniform(top, bottom, n)
+    mid_x = int(settings.WINDOW_WIDTH / 2)
+    mid_y = int(settings.WINDOW_HEIGHT / 2)
+    max_left_x = mid_x - (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
+    min_right_x = mid_x + (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
+    max_top_y = mid_y - (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
+    min_bottom_y = mid_y + (Bot.SPAWN_RADIUS + Bot.HITBOX_RADIUS + 5)
+    x = np.where(rng.integers(0, 2, n) == 0, rng.uniform(0, max_left_x, n), rng.uniform(min_right_x, settings.WINDOW_WIDTH, n))
+    y = np.where(rng.integers(0, 2, n) == 0, rng.uniform(0, max_top_y, n), rng.uniform(min_bottom_y, settings.WINDOW_HEIGHT, n))
+    return x, y
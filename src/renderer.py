@@ -0,0 +1,75 @@
+"""
+This module implements the renderer used to draw a population with pygame.
+"""
+
+import numpy as np
+import pygame as pg
+from population import Bot, Food
+
+class Renderer:
+    """
+    Draws the bots and food of a population. Entities that are off screen are
+    skipped. Bots are drawn with 'pygame.draw' as before, but the ends of their
+    field-of-vision lines are computed for every bot at once. Above
+    'antenna_limit' bots the renderer switches to reduced detail and leaves
+    out the field-of-vision lines.
+    """
+
+    # The field-of-vision lines reach this many pixels past a bot's body.
+    PROTRUSION = int(Bot.HITBOX_RADIUS * 1.5)
+    LINE_THICKNESS = 1
+
+    def __init__(self, antenna_limit = 2000):
+        """
+        Creates a 'Renderer' drawing field-of-vision lines for up to
+        'antenna_limit' bots ('None' for no limit).
+        """
+        self.ANTENNA_LIMIT = antenna_limit
+
+    def draw(self, window, pop):
+        """
+        Draws the food and living bots of 'pop' onto 'window'.
+        """
+        width, height = window.get_size()
+
+        food = _on_screen(pop.food_x, pop.food_y, Food.HITBOX_RADIUS, width, height)
+        food_x = pop.food_x[food].astype(int)
+        food_y = pop.food_y[food].astype(int)
+        for x, y in zip(food_x.tolist(), food_y.tolist()):
+            pg.draw.circle(window, Food.RGB, (x, y), Food.HITBOX_RADIUS)
+
+        alive = np.flatnonzero(pop.alive)
+        antennas = self.ANTENNA_LIMIT is None or len(alive) <= self.ANTENNA_LIMIT
+        reach = Bot.HITBOX_RADIUS + (self.PROTRUSION if antennas else 0)
+        bots = alive[_on_screen(pop.x[alive], pop.y[alive], reach, width, height)]
+        self._draw_bots(window, pop, bots, antennas)
+
+    def _draw_bots(self, window, pop, bots, antennas):
+        """
+        Draws the bots at indices 'bots' with 'pygame.draw'.
+        """
+        x = pop.x[bots]
+        y = pop.y[bots]
+        rgb = list(map(tuple, pop.rgb[bots].tolist()))
+        for color, center in zip(rgb, zip(x.astype(int).tolist(), y.astype(int).tolist())):
+            pg.draw.circle(window, color, center, Bot.HITBOX_RADIUS)
+        if antennas:
+            to_x, to_y = _antenna_ends(x, y, pop.theta[bots], Bot.HITBOX_RADIUS + self.PROTRUSION)
+            for color, start, left, right in zip(rgb, zip(x.tolist(), y.tolist()), zip(to_x[0].astype(int).tolist(), to_y[0].astype(int).tolist()), zip(to_x[1].astype(int).tolist(), to_y[1].astype(int).tolist())):
+                pg.draw.line(window, color, start, left, self.LINE_THICKNESS)
+                pg.draw.line(window, color, start, right, self.LINE_THICKNESS)
+
+def _antenna_ends(x, y, theta, length):
+    """
+    Ends of the two field-of-vision lines of bots at ('x', 'y') facing
+    'theta', as two '(2, ...)' arrays of x and y coordinates.
+    """
+    edges = np.stack((np.subtract(theta, Bot.FIELD_OF_VISION_THETA / 2), np.add(theta, Bot.FIELD_OF_VISION_THETA / 2)))
+    return x + length * np.cos(edges), y - length * np.sin(edges)
+
+def _on_screen(x, y, radius, width, height):
+    """
+    Mask of the entities at ('x', 'y') that reach within 'radius' of a
+    'width' x 'height' screen.
+    """
+    return (x >= -radius) & (x <= width + radius) & (y >= -radius) & (y <= height + radius)
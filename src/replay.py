@@ -0,0 +1,204 @@
+"""
+This module implements recording a run tick by tick and playing it back
+without simulating it.
+
+A replay is a directory holding 'replay.json' (the settings of the run) and
+three flat binary files, which are memory-mapped when played back:
+
+'ticks.bin'  One entry per tick: where its bots and food events start, how many
+             there are, and whether the tick is a keyframe.
+'bots.bin'   The bots of every tick: positions quantized to 'POSITION_SCALE'ths
+             of a pixel (int16), headings quantized to 1/256 of a turn (uint8)
+             and colors.
+'food.bin'   Food events: an item moving to (or appearing at) a position. A
+             keyframe holds an event for every food item, so the food at any
+             tick is found by replaying the events since the last keyframe.
+"""
+
+import json
+import os
+import numpy as np
+import settings
+
+FORMAT = "bot-evolution-replay"
+VERSION = 1
+
+# Positions are stored in units of 1 / 'POSITION_SCALE' pixels.
+POSITION_SCALE = 4
+HEADING_STEPS = 256
+
+TICK = np.dtype([("bot_start", "<i8"), ("bots", "<i4"), ("food_start", "<i8"), ("food_events", "<i4"), ("food", "<i4"), ("keyframe", "u1")])
+BOT = np.dtype([("x", "<i2"), ("y", "<i2"), ("theta", "u1"), ("rgb", "u1", (3,))])
+FOOD_EVENT = np.dtype([("index", "<i4"), ("x", "<f4"), ("y", "<f4")])
+
+class ReplayRecorder:
+    """
+    Appends the state of a population to a replay after every tick (see
+    'record'). Writes are buffered; 'close' must be called when done.
+    """
+
+    def __init__(self, directory, keyframe_interval = 600):
+        """
+        Creates a 'ReplayRecorder' writing a new replay to 'directory'
+        (replacing any replay already there), with a food keyframe every
+        'keyframe_interval' ticks.
+        """
+        assert(keyframe_interval >= 1)
+        self.DIRECTORY = directory
+        self.KEYFRAME_INTERVAL = keyframe_interval
+        os.makedirs(directory, exist_ok = True)
+        meta = {
+            "format": FORMAT,
+            "version": VERSION,
+            "position_scale": POSITION_SCALE,
+            "heading_steps": HEADING_STEPS,
+            "keyframe_interval": keyframe_interval,
+            "settings": {
+                "fps": settings.FPS,
+                "window_width": settings.WINDOW_WIDTH,
+                "window_height": settings.WINDOW_HEIGHT,
+            },
+        }
+        with open(os.path.join(directory, "replay.json"), "w") as f:
+            json.dump(meta, f, indent = 2)
+        self._files = {name: open(os.path.join(directory, name + ".bin"), "wb", buffering = 1 << 20) for name in ("ticks", "bots", "food")}
+        self.ticks = 0
+        self._bot_start = 0
+        self._food_start = 0
+        self._food_x = np.zeros(0, dtype = np.float32)
+        self._food_y = np.zeros(0, dtype = np.float32)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, pop):
+        """
+        Appends the current state of 'pop' as the next tick.
+        """
+        alive = np.flatnonzero(pop.alive)
+        bots = np.empty(len(alive), dtype = BOT)
+        limit = np.iinfo(np.int16)
+        bots["x"] = np.clip(np.rint(pop.x[alive] * POSITION_SCALE), limit.min, limit.max)
+        bots["y"] = np.clip(np.rint(pop.y[alive] * POSITION_SCALE), limit.min, limit.max)
+        bots["theta"] = np.rint(pop.theta[alive] * (HEADING_STEPS / (2 * np.pi))).astype(np.int64) % HEADING_STEPS
+        bots["rgb"] = pop.rgb[alive]
+
+        food_x = pop.food_x.astype(np.float32)
+        food_y = pop.food_y.astype(np.float32)
+        keyframe = self.ticks % self.KEYFRAME_INTERVAL == 0 or len(food_x) != len(self._food_x)
+        if keyframe:
+            changed = np.arange(len(food_x))
+        else:
+            changed = np.flatnonzero((food_x != self._food_x) | (food_y != self._food_y))
+        events = np.empty(len(changed), dtype = FOOD_EVENT)
+        events["index"] = changed
+        events["x"] = food_x[changed]
+        events["y"] = food_y[changed]
+        self._food_x = food_x
+        self._food_y = food_y
+
+        tick = np.array([(self._bot_start, len(bots), self._food_start, len(events), len(food_x), keyframe)], dtype = TICK)
+        self._files["bots"].write(bots.tobytes())
+        self._files["food"].write(events.tobytes())
+        self._files["ticks"].write(tick.tobytes())
+        self._bot_start += len(bots)
+        self._food_start += len(events)
+        self.ticks += 1
+
+    def flush(self):
+        """
+        Writes the buffered ticks to disk.
+        """
+        for f in self._files.values():
+            f.flush()
+
+    def close(self):
+        """
+        Writes the buffered ticks and closes the replay.
+        """
+        for f in self._files.values():
+            f.close()
+
+class ReplayFrame:
+    """
+    The state of a replay at one tick. It has the attributes a 'Renderer'
+    draws from, so it can be drawn in place of a population.
+    """
+
+    def __init__(self, tick, bots, food_x, food_y):
+        self.tick = tick
+        self.x = bots["x"] / float(POSITION_SCALE)
+        self.y = bots["y"] / float(POSITION_SCALE)
+        self.theta = bots["theta"] * (2 * np.pi / HEADING_STEPS)
+        self.rgb = bots["rgb"]
+        self.alive = np.ones(len(bots), dtype = bool)
+        self.food_x = food_x
+        self.food_y = food_y
+
+class Replay:
+    """
+    A recorded replay, memory-mapped for playback. Any tick can be looked up
+    ('frame'); the food is rebuilt from the last keyframe, or from the
+    previously looked up tick when playing forwards.
+    """
+
+    def __init__(self, directory):
+        """
+        Opens the replay in 'directory'.
+        """
+        with open(os.path.join(directory, "replay.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT:
+            raise ValueError("not a replay")
+        if self.meta["version"] > VERSION:
+            raise ValueError("replay version %d is newer than the supported version %d" % (self.meta["version"], VERSION))
+        self.ticks = _map(os.path.join(directory, "ticks.bin"), TICK)
+        self.bots = _map(os.path.join(directory, "bots.bin"), BOT)
+        self.food = _map(os.path.join(directory, "food.bin"), FOOD_EVENT)
+        self.keyframes = np.flatnonzero(self.ticks["keyframe"])
+        self._food_tick = -1
+        self._food_x = np.zeros(0)
+        self._food_y = np.zeros(0)
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def frame(self, tick):
+        """
+        The state at tick 'tick'.
+        """
+        entry = self.ticks[tick]
+        bots = self.bots[entry["bot_start"]:entry["bot_start"] + entry["bots"]]
+        food_x, food_y = self._food_at(tick)
+        return ReplayFrame(tick, bots, food_x, food_y)
+
+    def _food_at(self, tick):
+        """
+        The food positions at tick 'tick'.
+        """
+        keyframe = self.keyframes[np.searchsorted(self.keyframes, tick, side = "right") - 1]
+        if not (keyframe <= self._food_tick <= tick):
+            # Start over from the keyframe.
+            self._food_tick = keyframe - 1
+        for t in range(self._food_tick + 1, tick + 1):
+            entry = self.ticks[t]
+            if entry["keyframe"]:
+                self._food_x = np.zeros(entry["food"])
+                self._food_y = np.zeros(entry["food"])
+            events = self.food[entry["food_start"]:entry["food_start"] + entry["food_events"]]
+            self._food_x[events["index"]] = events["x"]
+            self._food_y[events["index"]] = events["y"]
+        self._food_tick = tick
+        return self._food_x.copy(), self._food_y.copy()
+
+def _map(path, dtype):
+    """
+    Memory-maps the records of 'dtype' in the file at 'path'.
+    """
+    count = os.path.getsize(path) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype = dtype)
+    return np.memmap(path, dtype = dtype, mode = "r", shape = (count,))
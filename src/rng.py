@@ -0,0 +1,41 @@
+"""
+This module implements the random number streams used by a population.
+"""
+
+import numpy as np
+
+class RandomStreams:
+    """
+    One independent random number generator per subsystem, all derived from a
+    single master seed. Two populations created with the same seed evolve
+    identically.
+    """
+
+    # Names of the streams: bot spawning (positions, headings and colors),
+    # mutation, food placement and neural network weight initialization.
+    NAMES = ("spawning", "mutation", "food", "weights")
+
+    def __init__(self, seed = None):
+        """
+        Creates the streams for master seed 'seed'. If 'seed' is 'None', a
+        random seed is picked (and recorded, so that the run can still be
+        reproduced).
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.SEED = seed
+        for name, child in zip(RandomStreams.NAMES, np.random.SeedSequence(seed).spawn(len(RandomStreams.NAMES))):
+            setattr(self, name, np.random.Generator(np.random.PCG64(child)))
+
+    def get_state(self):
+        """
+        The state of every stream, by name.
+        """
+        return {name: getattr(self, name).bit_generator.state for name in RandomStreams.NAMES}
+
+    def set_state(self, state):
+        """
+        Restores the state of every stream from 'get_state'.
+        """
+        for name in RandomStreams.NAMES:
+            getattr(self, name).bit_generator.state = state[name]
@@ -6,3 +6,17 @@ FPS = 60
 WINDOW_WIDTH = 1100
 WINDOW_HEIGHT = 600
 TIME_MULTIPLIER = 1.0
+
+def capture():
+    """
+    The current settings, to be passed to 'apply' (for example in another
+    process).
+    """
+    return (FPS, WINDOW_WIDTH, WINDOW_HEIGHT, TIME_MULTIPLIER)
+
+def apply(config):
+    """
+    Sets the settings to those returned by 'capture'.
+    """
+    global FPS, WINDOW_WIDTH, WINDOW_HEIGHT, TIME_MULTIPLIER
+    FPS, WINDOW_WIDTH, WINDOW_HEIGHT, TIME_MULTIPLIER = config
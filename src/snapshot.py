@@ -0,0 +1,167 @@
+"""
+This module implements the snapshot format used to save and load a population.
+
+A snapshot is an uncompressed '.npz' archive. Its 'header' entry is a JSON
+document (stored as bytes) holding the format version, the settings, the
+population's parameters and world and the state of its random number streams. Every
+other entry is one contiguous array of bot state, food state or network
+parameters (one row per distinct genome, with every bot referring to a row).
+Entries are only read when accessed, so parts of a snapshot (e.g. just the
+weights) can be loaded without reading the rest.
+"""
+
+import json
+import numpy as np
+import settings
+import population
+import neural_network
+from world import World
+
+FORMAT = "bot-evolution-snapshot"
+VERSION = 4
+
+def save(path_or_file, pop):
+    """
+    Saves 'pop' and the current settings to 'path_or_file' (a path or a
+    binary file object).
+    """
+    write(path_or_file, capture(pop))
+
+def capture(pop):
+    """
+    Copies the state of 'pop' and the current settings, so that it can be
+    written later (possibly from another thread) while 'pop' keeps changing.
+    """
+    header = {
+        "format": FORMAT,
+        "version": VERSION,
+        "settings": {
+            "fps": settings.FPS,
+            "window_width": settings.WINDOW_WIDTH,
+            "window_height": settings.WINDOW_HEIGHT,
+            "time_multiplier": settings.TIME_MULTIPLIER,
+        },
+        "population": {
+            "size": pop.SIZE,
+            "mutation_rate": pop.mutation_rate,
+            "time_since_last_death": pop.time_since_last_death,
+            "layer_sizes": list(pop.LAYER_SIZES),
+            "activation_funcs": [func.__name__ for func in pop.ACTIVATION_FUNCS],
+        },
+        "world": pop.world.to_dict(),
+        "rng": {
+            "seed": pop.rng.SEED,
+            "state": pop.rng.get_state(),
+        },
+    }
+    alive = pop.alive
+    used, genome = np.unique(pop.genome[alive], return_inverse = True)
+    arrays = {
+        "header": np.frombuffer(json.dumps(header).encode("utf-8"), dtype = np.uint8),
+        "bot_x": pop.x[alive],
+        "bot_y": pop.y[alive],
+        "bot_theta": pop.theta[alive],
+        "bot_score": pop.score[alive],
+        "bot_rgb": pop.rgb[alive],
+        "bot_genome": genome.astype(np.int32),
+        "genomes": pop.nnet_batch.params[used],
+        "food_x": pop.food_x.copy(),
+        "food_y": pop.food_y.copy(),
+    }
+    return arrays
+
+def write(path_or_file, captured):
+    """
+    Writes a state copied by 'capture' to 'path_or_file' (a path or a binary
+    file object).
+    """
+    if isinstance(path_or_file, str):
+        with open(path_or_file, "wb") as f:
+            np.savez(f, **captured)
+    else:
+        np.savez(path_or_file, **captured)
+
+def load_header(path):
+    """
+    Reads only the header of the snapshot at 'path'.
+    """
+    with np.load(path) as archive:
+        return _read_header(archive)
+
+def load_genomes(path):
+    """
+    Reads only the network parameters of the snapshot at 'path': the distinct
+    genomes (one parameter vector per row) and the row used by every bot.
+    """
+    with np.load(path) as archive:
+        return _read_genomes(archive, _read_header(archive))
+
+def load_weights(path):
+    """
+    Reads only the network weights of every bot (one stacked '(bots, from,
+    to)' array per connection) of the snapshot at 'path'.
+    """
+    with np.load(path) as archive:
+        header = _read_header(archive)
+        genomes, genome = _read_genomes(archive, header)
+        return _batch(header).unflatten(genomes[genome])
+
+def load(path, apply_settings = True):
+    """
+    Reads the population saved in the snapshot at 'path'. The saved settings
+    are applied unless 'apply_settings' is 'False'.
+    """
+    with np.load(path) as archive:
+        header = _read_header(archive)
+        params = header["population"]
+        # Snapshots older than version 4 were all taken in the default world.
+        world = World.from_dict(header.get("world", {}))
+        hidden = params["layer_sizes"][1:-1]
+        layer_sizes, activation_funcs = population.Population.network_shape(world, hidden)
+        if tuple(params["layer_sizes"]) != layer_sizes or params["activation_funcs"] != [func.__name__ for func in activation_funcs]:
+            raise ValueError("snapshot '%s' holds networks of an unsupported shape" % path)
+        if apply_settings:
+            settings.FPS = header["settings"]["fps"]
+            settings.WINDOW_WIDTH = header["settings"]["window_width"]
+            settings.WINDOW_HEIGHT = header["settings"]["window_height"]
+            settings.TIME_MULTIPLIER = header["settings"]["time_multiplier"]
+        genomes, genome = _read_genomes(archive, header)
+        pop = population.Population.from_arrays(params["size"], params["mutation_rate"],
+            archive["bot_x"], archive["bot_y"], archive["bot_theta"], archive["bot_score"], archive["bot_rgb"],
+            genomes, genome, archive["food_x"], archive["food_y"], header["rng"]["seed"] if "rng" in header else None, world, hidden)
+        pop.time_since_last_death = params["time_since_last_death"]
+        if "rng" in header:
+            pop.rng.set_state(header["rng"]["state"])
+        return pop
+
+def _batch(header):
+    """
+    An empty 'BatchedNNetwork' shaped like the networks of a snapshot.
+    """
+    params = header["population"]
+    funcs = [getattr(neural_network, name) for name in params["activation_funcs"]]
+    return neural_network.BatchedNNetwork(params["layer_sizes"], funcs)
+
+def _read_genomes(archive, header):
+    """
+    Reads the genomes and the genome of every bot of an opened snapshot.
+    Snapshots older than version 3 hold one stacked weight array per
+    connection instead, which is converted.
+    """
+    if header["version"] >= 3:
+        return archive["genomes"], archive["bot_genome"]
+    weights = [archive["weights_%d" % k] for k in range(len(header["population"]["layer_sizes"]) - 1)]
+    return _batch(header).flatten(weights), np.arange(len(weights[0]))
+
+def _read_header(archive):
+    """
+    Decodes and checks the header of an opened snapshot.
+    """
+    if "header" not in archive.files:
+        raise ValueError("not a snapshot")
+    header = json.loads(archive["header"].tobytes().decode("utf-8"))
+    if header.get("format") != FORMAT:
+        raise ValueError("not a snapshot")
+    if header["version"] > VERSION:
+        raise ValueError("snapshot version %d is newer than the supported version %d" % (header["version"], VERSION))
+    return header
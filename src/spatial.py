@@ -0,0 +1,128 @@
+"""
+This module implements a uniform grid used to quickly find the bots and food
+near a point or inside a bot's field of vision.
+"""
+
+import numpy as np
+
+class UniformGrid:
+    """
+    Buckets points into square cells of equal size. Only non-empty cells are
+    stored, so the grid works for points anywhere on (or off) the map. The grid
+    is rebuilt from scratch with 'build' whenever the points move.
+    """
+
+    def __init__(self, cell_size):
+        """
+        Creates an empty 'UniformGrid' whose cells are 'cell_size' pixels wide.
+        """
+        assert(cell_size > 0)
+        self.CELL_SIZE = cell_size
+        self.build(np.zeros(0), np.zeros(0))
+
+    def build(self, x, y):
+        """
+        Buckets the points ('x', 'y'). Points are identified by their index in
+        these arrays.
+        """
+        col = np.floor(np.asarray(x) / self.CELL_SIZE).astype(np.int64)
+        row = np.floor(np.asarray(y) / self.CELL_SIZE).astype(np.int64)
+        keys = _cell_key(col, row)
+
+        # Point indices grouped by cell, in ascending order within each cell.
+        self.order = np.argsort(keys, kind = "stable")
+        self.keys, self.starts, self.counts = np.unique(keys[self.order], return_index = True, return_counts = True)
+        first = self.order[self.starts]
+        self.cols = col[first]
+        self.rows = row[first]
+
+        # The non-empty cell of every point.
+        self.cell = np.empty(len(keys), dtype = np.int64)
+        self.cell[self.order] = np.repeat(np.arange(len(self.keys)), self.counts)
+
+    def __len__(self):
+        """
+        Number of non-empty cells.
+        """
+        return len(self.keys)
+
+    def members(self, cell):
+        """
+        Indices of the points in the 'cell'-th non-empty cell.
+        """
+        return self.order[self.starts[cell]:self.starts[cell] + self.counts[cell]]
+
+    def near(self, x, y, radius):
+        """
+        Indices (in ascending order) of every point that may lie within
+        'radius' of ('x', 'y'). Callers still need to check the exact distance.
+        """
+        cols = np.arange(int(np.floor((x - radius) / self.CELL_SIZE)), int(np.floor((x + radius) / self.CELL_SIZE)) + 1)
+        rows = np.arange(int(np.floor((y - radius) / self.CELL_SIZE)), int(np.floor((y + radius) / self.CELL_SIZE)) + 1)
+        keys = _cell_key(np.repeat(cols, len(rows)), np.tile(rows, len(cols)))
+        cells = np.searchsorted(self.keys, keys)
+        cells = cells[(cells < len(self.keys)) & (self.keys[np.minimum(cells, len(self.keys) - 1)] == keys)]
+        if len(cells) == 0:
+            return np.zeros(0, dtype = np.int64)
+        return np.sort(np.concatenate([self.members(cell) for cell in cells]))
+
+    def occupied_near(self, x, y, radius):
+        """
+        For every point ('x', 'y') (arrays), whether a point of the grid may
+        lie within 'radius' of it, which is at most the cell size. Callers
+        still need to check the exact distance.
+        """
+        assert(radius <= self.CELL_SIZE)
+        col = np.floor(np.asarray(x) / self.CELL_SIZE).astype(np.int64)
+        row = np.floor(np.asarray(y) / self.CELL_SIZE).astype(np.int64)
+        occupied = np.zeros(len(col), dtype = bool)
+        if len(self.keys) == 0:
+            return occupied
+        for dc in (-1, 0, 1):
+            for dr in (-1, 0, 1):
+                keys = _cell_key(col + dc, row + dr)
+                cells = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+                occupied |= self.keys[cells] == keys
+        return occupied
+
+    def cells_in_view(self, x, y, theta, half_angle):
+        """
+        For viewers at ('x', 'y') looking along 'theta' with a field of vision
+        of 'half_angle' radians on either side (and unlimited range), returns a
+        boolean '(viewers, cells)' mask of the cells that may contain a point
+        in view. Angles are measured like 'utility.find_angle', i.e.
+        counterclockwise on screen where y grows downwards.
+        """
+        x = np.asarray(x, dtype = float)[:, None, None]
+        y = np.asarray(y, dtype = float)[:, None, None]
+        theta = np.asarray(theta, dtype = float)[:, None]
+        left = (self.cols * self.CELL_SIZE)[None, :]
+        top = (self.rows * self.CELL_SIZE)[None, :]
+        corners_x = np.stack((left, left + self.CELL_SIZE, left + self.CELL_SIZE, left), axis = -1)
+        corners_y = np.stack((top, top, top + self.CELL_SIZE, top + self.CELL_SIZE), axis = -1)
+
+        # Seen from outside, a cell spans less than half a turn, so its extent
+        # can be measured relative to the direction of its center.
+        center = np.arctan2(y[..., 0] - (top + self.CELL_SIZE / 2.0), (left + self.CELL_SIZE / 2.0) - x[..., 0])
+        corners = _wrap(np.arctan2(y - corners_y, corners_x - x) - center[..., None])
+        lo = corners.min(axis = -1)
+        hi = corners.max(axis = -1)
+        mid = _wrap(center + (lo + hi) / 2.0 - theta)
+        in_view = np.abs(mid) <= half_angle + (hi - lo) / 2.0
+
+        # A viewer inside (or on the edge of) a cell may see any of its points.
+        inside = (x[..., 0] >= left) & (x[..., 0] <= left + self.CELL_SIZE) & (y[..., 0] >= top) & (y[..., 0] <= top + self.CELL_SIZE)
+        return in_view | inside
+
+def _cell_key(col, row):
+    """
+    Packs cell columns and rows into single integers that sort by column, then
+    row.
+    """
+    return col * 2 ** 32 + (row + 2 ** 31)
+
+def _wrap(angle):
+    """
+    Wraps angles (in radians) into [-pi, pi).
+    """
+    return np.mod(angle + np.pi, 2 * np.pi) - np.pi
@@ -0,0 +1,283 @@
+"""
+This module implements hyperparameter sweeps: many headless runs, over a grid
+or a random sample of population sizes, mutation rates and network shapes,
+spread over a pool of worker processes and collected into one results table.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+import settings
+import population
+from engine import Engine, parse_hidden
+
+# The parameters of a trial, in the order of the results table.
+PARAMETERS = ("size", "mutation_rate", "hidden", "seed")
+METRICS = ("ticks", "seconds", "feeds", "feeds_per_minute", "final_feeds_per_minute", "mutations", "bots", "genomes", "best_score", "mean_score", "wall_seconds")
+
+# The fraction of a trial, at its end, over which 'final_feeds_per_minute' is
+# measured.
+FINAL_FRACTION = 0.25
+
+def grid(spec):
+    """
+    Every combination of the values listed in 'spec', a dictionary mapping
+    'size', 'mutation_rate' and 'hidden' to lists of values.
+    """
+    names = ("size", "mutation_rate", "hidden")
+    return [dict(zip(names, values)) for values in itertools.product(*(spec[name] for name in names))]
+
+def random_search(spec, n, rng):
+    """
+    'n' combinations drawn with 'rng' from 'spec', where every parameter is
+    either a list of values to choose from or a range
+    '{"min": a, "max": b, "log": false}' ('size' is rounded to an integer).
+    """
+    def draw(name, values):
+        if isinstance(values, dict):
+            low, high = values["min"], values["max"]
+            if values.get("log", False):
+                value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+            else:
+                value = float(rng.uniform(low, high))
+            return int(round(value)) if name == "size" else value
+        return values[rng.integers(len(values))]
+    return [{name: draw(name, spec[name]) for name in ("size", "mutation_rate", "hidden")} for i in range(n)]
+
+def trials(combinations, seeds):
+    """
+    Every combination run with every seed in 'seeds'.
+    """
+    return [dict(combination, seed = seed) for combination in combinations for seed in seeds]
+
+def trial_key(trial):
+    """
+    A string identifying 'trial' in the results table.
+    """
+    return "|".join(_format(name, trial[name]) for name in PARAMETERS)
+
+def run_trial(trial, ticks = None, seconds = None, dt = 1.0):
+    """
+    Evolves a population with the parameters of 'trial' for 'ticks' ticks or
+    'seconds' simulated seconds and returns its metrics.
+    """
+    pop = population.Population(trial["size"], trial["mutation_rate"], trial["seed"], hidden = trial["hidden"])
+    fitness = pop.history = _Fitness()
+    engine = Engine(pop, dt)
+    if seconds is not None:
+        total = seconds
+        done = lambda e: e.elapsed >= seconds
+    else:
+        total = ticks * 1.0 / settings.FPS * dt * settings.TIME_MULTIPLIER
+        done = lambda e: False
+    # Feeds are counted separately over the end of the run, to measure how
+    # well the evolved bots (rather than the random first ones) do.
+    final_start = total * (1 - FINAL_FRACTION)
+    engine.attach(lambda e: fitness.mark() if e.elapsed >= final_start else None)
+    start = time.perf_counter()
+    engine.run_until(done, ticks)
+    wall = time.perf_counter() - start
+    alive = np.flatnonzero(pop.alive)
+    final_seconds = engine.elapsed - fitness.final_elapsed if fitness.final_elapsed is not None else 0.0
+    return {
+        "ticks": engine.ticks,
+        "seconds": engine.elapsed,
+        "feeds": fitness.feeds,
+        "feeds_per_minute": 60.0 * fitness.feeds / engine.elapsed if engine.elapsed > 0 else 0.0,
+        "final_feeds_per_minute": 60.0 * fitness.final_feeds / final_seconds if final_seconds > 0 else 0.0,
+        "mutations": fitness.mutations,
+        "bots": len(alive),
+        "genomes": len(np.unique(pop.genome[alive])),
+        "best_score": float(pop.score[alive].max()),
+        "mean_score": float(pop.score[alive].mean()),
+        "wall_seconds": wall,
+    }
+
+class _Fitness:
+    """
+    Counts the feeds and mutations of a population, standing in for its
+    'history' recorder. Feeds after 'mark' are also counted separately.
+    """
+
+    def __init__(self):
+        self.feeds = 0
+        self.mutations = 0
+        self.final_feeds = 0
+        self.elapsed = 0.0
+        self.final_elapsed = None
+
+    def mark(self):
+        if self.final_elapsed is None:
+            self.final_elapsed = self.elapsed
+
+    def feed(self, pop, bot, children, mutated):
+        self.feeds += 1
+        self.mutations += len(mutated)
+        if self.final_elapsed is not None:
+            self.final_feeds += 1
+
+    def actions(self, actions):
+        pass
+
+    def tick(self, pop, step):
+        self.elapsed += step
+
+class Sweep:
+    """
+    Runs trials over a pool of worker processes and appends a row of
+    parameters and metrics to a CSV results table as each one finishes.
+    Trials already in the table are skipped, so an interrupted sweep resumes
+    where it stopped when run again.
+    """
+
+    def __init__(self, path, ticks = None, seconds = None, dt = 1.0, processes = None):
+        """
+        Creates a 'Sweep' writing to the results table at 'path'. Every trial
+        runs for 'ticks' ticks or 'seconds' simulated seconds.
+        """
+        assert(ticks is not None or seconds is not None)
+        self.PATH = path
+        self.TICKS = ticks
+        self.SECONDS = seconds
+        self.DT = dt
+        self.PROCESSES = processes or multiprocessing.cpu_count()
+
+    def completed(self):
+        """
+        The keys of the trials already in the results table.
+        """
+        if not os.path.isfile(self.PATH):
+            return set()
+        with open(self.PATH, newline = "") as f:
+            # A row cut short by an interruption is ignored (and rerun).
+            return {trial_key(_parse(row)) for row in csv.DictReader(f) if None not in row.values() and all(row.values())}
+
+    def run(self, trials, report = None):
+        """
+        Runs the 'trials' not in the results table yet, calling
+        'report(trial, metrics)' as each one finishes. Returns the number of
+        trials run.
+        """
+        done = self.completed()
+        pending = [trial for trial in trials if trial_key(trial) not in done]
+        if not pending:
+            return 0
+        new = not os.path.isfile(self.PATH) or os.path.getsize(self.PATH) == 0
+        config = settings.capture()
+        with open(self.PATH, "a", newline = "") as f:
+            writer = csv.DictWriter(f, PARAMETERS + METRICS)
+            if new:
+                writer.writeheader()
+            elif not _ends_with_newline(self.PATH):
+                f.write("\r\n")
+            with multiprocessing.Pool(min(self.PROCESSES, len(pending)), settings.apply, (config,)) as pool:
+                jobs = [(trial, self.TICKS, self.SECONDS, self.DT) for trial in pending]
+                for trial, metrics in pool.imap_unordered(_run_job, jobs):
+                    writer.writerow(dict({name: _format(name, trial[name]) for name in PARAMETERS}, **metrics))
+                    f.flush()
+                    if report is not None:
+                        report(trial, metrics)
+        return len(pending)
+
+def load(path):
+    """
+    Reads the results table at 'path' as a list of dictionaries.
+    """
+    with open(path, newline = "") as f:
+        rows = [row for row in csv.DictReader(f) if None not in row.values() and all(row.values())]
+    return [dict(_parse(row), **{name: float(row[name]) for name in METRICS}) for row in rows]
+
+def summarize(rows, metric = "final_feeds_per_minute"):
+    """
+    The mean and standard deviation of 'metric' over the seeds of every
+    combination of parameters in 'rows', best first.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault((row["size"], row["mutation_rate"], tuple(row["hidden"])), []).append(row[metric])
+    summary = [{"size": size, "mutation_rate": mutation_rate, "hidden": list(hidden), "runs": len(values), "mean": float(np.mean(values)), "std": float(np.std(values))}
+        for (size, mutation_rate, hidden), values in groups.items()]
+    return sorted(summary, key = lambda entry: -entry["mean"])
+
+def _run_job(job):
+    trial, ticks, seconds, dt = job
+    return trial, run_trial(trial, ticks, seconds, dt)
+
+def _format(name, value):
+    """
+    'value' of parameter 'name' as written in the results table.
+    """
+    if name == "hidden":
+        return "-".join(str(int(size)) for size in value) or "none"
+    if name == "mutation_rate":
+        return repr(float(value))
+    return str(int(value))
+
+def _parse(row):
+    """
+    The parameters of a row of the results table.
+    """
+    return {
+        "size": int(row["size"]),
+        "mutation_rate": float(row["mutation_rate"]),
+        "hidden": [] if row["hidden"] == "none" else [int(size) for size in row["hidden"].split("-")],
+        "seed": int(row["seed"]),
+    }
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Runs a hyperparameter sweep of headless populations in parallel.")
+    parser.add_argument("--spec", metavar = "FILE", help = "JSON file with the values (or, for --random, ranges) of 'size', 'mutation_rate' and 'hidden'")
+    parser.add_argument("--size", type = int, nargs = "+", default = [50], help = "population sizes")
+    parser.add_argument("--mutation-rate", type = float, nargs = "+", default = [0.1], help = "mutation rates")
+    parser.add_argument("--hidden", type = parse_hidden, nargs = "+", default = [[2]], metavar = "A,B,...", help = "hidden layer sizes of the networks ('none' for no hidden layer)")
+    parser.add_argument("--random", type = int, metavar = "N", help = "draw N random combinations instead of running the whole grid")
+    parser.add_argument("--seeds", type = int, default = 1, help = "number of seeds every combination is run with")
+    parser.add_argument("--seed", type = int, default = 0, help = "first seed (also seeds the random search)")
+    parser.add_argument("--ticks", type = int, help = "ticks every trial runs for")
+    parser.add_argument("--seconds", type = float, help = "simulated seconds every trial runs for")
+    parser.add_argument("--dt", type = float, default = 1.0, help = "time step of every tick, in frames")
+    parser.add_argument("--processes", type = int, help = "number of worker processes (by default, one per core)")
+    parser.add_argument("--output", default = "sweep.csv", help = "results table to append to (trials already in it are skipped)")
+    parser.add_argument("--top", type = int, default = 10, help = "number of best combinations to print")
+    args = parser.parse_args(argv)
+    if args.ticks is None and args.seconds is None:
+        parser.error("one of --ticks or --seconds is required")
+
+    if args.spec:
+        with open(args.spec) as f:
+            spec = json.load(f)
+    else:
+        spec = {"size": args.size, "mutation_rate": args.mutation_rate, "hidden": args.hidden}
+    if args.random is not None:
+        combinations = random_search(spec, args.random, np.random.default_rng(args.seed))
+    else:
+        combinations = grid(spec)
+    for combination in combinations:
+        if combination["size"] < 5:
+            parser.error("population size must be at least 5")
+        if combination["mutation_rate"] <= 0 or combination["mutation_rate"] >= 1:
+            parser.error("mutation rate must be in the range (0, 1)")
+        if any(size < 1 for size in combination["hidden"]):
+            parser.error("hidden layers must have at least 1 neuron")
+
+    sweep = Sweep(args.output, args.ticks, args.seconds, args.dt, args.processes)
+    all_trials = trials(combinations, range(args.seed, args.seed + args.seeds))
+    report = lambda trial, metrics: print("%s: %.2f feeds/min (%.2f at the end) in %.1f s" % (trial_key(trial), metrics["feeds_per_minute"], metrics["final_feeds_per_minute"], metrics["wall_seconds"]))
+    start = time.perf_counter()
+    ran = sweep.run(all_trials, report)
+    print("%d of %d trials run (the others were already done) in %.2f s" % (ran, len(all_trials), time.perf_counter() - start))
+    for entry in summarize(load(args.output))[:args.top]:
+        print("size %d, mutation rate %g, hidden %s: %.2f +- %.2f final feeds/min over %d runs" % (entry["size"], entry["mutation_rate"], entry["hidden"] or "none", entry["mean"], entry["std"], entry["runs"]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+This module implements the instrumentation used to see where the time of a
+tick goes: per-phase timers, event counters and rolling statistics.
+"""
+
+import collections
+import time
+import numpy as np
+
+class Telemetry:
+    """
+    Records how long every phase of a tick takes and how often events happen,
+    over the last 'window' ticks. Phases may be nested; the time of a phase
+    excludes the phases run inside it. A population reports to its
+    'telemetry' attribute, which is 'DISABLED' (and costs next to nothing)
+    unless a 'Telemetry' is assigned.
+    """
+
+    def __init__(self, window = 300):
+        """
+        Creates a 'Telemetry' keeping statistics over the last 'window' ticks.
+        """
+        assert(window >= 2)
+        self.WINDOW = window
+        self.ticks = 0
+        self.counts = collections.Counter()
+        self.durations = {}
+        self._phases = {}
+        self._stack = []
+        self._history = collections.deque(maxlen = window)
+        self._history.append((time.perf_counter(), 0, {}))
+
+    def phase(self, name):
+        """
+        A context manager timing phase 'name'.
+        """
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+            self.durations[name] = collections.deque(maxlen = self.WINDOW)
+        return phase
+
+    def count(self, name, n = 1):
+        """
+        Adds 'n' occurrences of event 'name'.
+        """
+        self.counts[name] += n
+
+    def tick(self):
+        """
+        Marks the end of a tick.
+        """
+        self.ticks += 1
+        self._history.append((time.perf_counter(), self.ticks, dict(self.counts)))
+
+    def summary(self):
+        """
+        The statistics of the last 'window' ticks: ticks per second, the mean
+        and percentiles of every phase's duration (in milliseconds) and the
+        total and rate per second of every event.
+        """
+        start, start_ticks, start_counts = self._history[0]
+        end, end_ticks, end_counts = self._history[-1]
+        elapsed = end - start
+        rate = lambda n: n / elapsed if elapsed > 0 else 0.0
+        phases = {}
+        for name, durations in self.durations.items():
+            if durations:
+                ms = np.array(durations) * 1000.0
+                p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+                phases[name] = {"mean_ms": float(ms.mean()), "p50_ms": float(p50), "p90_ms": float(p90), "p99_ms": float(p99)}
+        counters = {name: {"total": total, "per_second": rate(end_counts.get(name, 0) - start_counts.get(name, 0))} for name, total in self.counts.items()}
+        return {"ticks": self.ticks, "ticks_per_second": rate(end_ticks - start_ticks), "phases": phases, "counters": counters}
+
+    def lines(self):
+        """
+        The summary as short lines of text, for an overlay.
+        """
+        summary = self.summary()
+        lines = ["%.0f ticks/s" % summary["ticks_per_second"]]
+        for name, stats in summary["phases"].items():
+            lines.append("%s: %.2f ms (p99 %.2f ms)" % (name, stats["p50_ms"], stats["p99_ms"]))
+        for name, stats in summary["counters"].items():
+            lines.append("%s: %.1f/s" % (name, stats["per_second"]))
+        return lines
+
+class _Phase:
+    """
+    The context manager timing one phase of a 'Telemetry'.
+    """
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.NAME = name
+
+    def __enter__(self):
+        # Every entry of the stack is the start of a running phase and the
+        # time spent in the phases nested inside it so far.
+        self.telemetry._stack.append([time.perf_counter(), 0.0])
+
+    def __exit__(self, *exc):
+        stack = self.telemetry._stack
+        start, nested = stack.pop()
+        duration = time.perf_counter() - start
+        self.telemetry.durations[self.NAME].append(duration - nested)
+        if stack:
+            stack[-1][1] += duration
+
+class _Disabled:
+    """
+    A stand-in for 'Telemetry' that records nothing.
+    """
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+    def phase(self, name):
+        return self
+
+    def count(self, name, n = 1):
+        pass
+
+    def tick(self):
+        pass
+
+DISABLED = _Disabled()
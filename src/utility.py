@@ -42,3 +42,59 @@ def distance_between(x1, y1, x2, y2):
     Calculates the distance between 2 points.
     """
     return np.hypot(x1 - x2, y1 - y2)
+
+def squared_distance(x1, y1, x2, y2):
+    """
+    Calculates the squared distance between points given as arrays (which
+    broadcast against each other). Compare it with a squared radius instead of
+    taking the square root.
+    """
+    dx = np.subtract(x1, x2)
+    dy = np.subtract(y1, y2)
+    return dx * dx + dy * dy
+
+def squared_distance_matrix(x1, y1, x2, y2):
+    """
+    Calculates the '(N, M)' matrix of squared distances between N points
+    ('x1', 'y1') and M points ('x2', 'y2').
+    """
+    return squared_distance(np.asarray(x1)[:, None], np.asarray(y1)[:, None], np.asarray(x2)[None, :], np.asarray(y2)[None, :])
+
+def in_field_of_vision(x, y, theta, fov, target_x, target_y, quantized = False):
+    """
+    Checks whether targets lie in the field of vision of viewers at ('x', 'y')
+    looking along 'theta', 'fov' radians wide and of unlimited range (arrays
+    broadcast against each other). Angles are measured like 'find_angle'. The
+    test is done with dot products; if 'quantized' is set, the whole-degree
+    rounding of 'find_angle' and 'angle_is_between' is reproduced exactly
+    instead.
+    """
+    dx = np.subtract(target_x, x)
+    dy = np.subtract(target_y, y)
+    if quantized:
+        # The same arithmetic as 'angle_is_between(find_angle(...), theta -
+        # fov / 2, theta + fov / 2)', including the conversion of the found
+        # angle back to radians and then to degrees again.
+        to_degrees = lambda rads: np.mod(np.trunc(rads * 180 / np.pi).astype(np.int64), 360)
+        angle = to_degrees(to_degrees(np.arctan2(-dy, dx)) * np.pi / 180)
+        a = to_degrees(np.subtract(theta, fov / 2))
+        b = to_degrees(np.add(theta, fov / 2))
+        return np.where(a < b, (a <= angle) & (angle <= b), (a <= angle) | (angle <= b))
+
+    # Screen y grows downwards, so the heading vector is (cos, -sin). A target
+    # is in view if the cosine of its angle to the heading is at least
+    # 'cos(fov / 2)', compared through squares to avoid a square root.
+    dot = np.cos(theta) * dx - np.sin(theta) * dy
+    limit = np.cos(fov / 2)
+    if limit >= 0:
+        return (dot >= 0) & (dot * dot >= limit * limit * (dx * dx + dy * dy))
+    return (dot >= 0) | (dot * dot <= limit * limit * (dx * dx + dy * dy))
+
+def vision_mask(x, y, theta, fov, target_x, target_y, quantized = False):
+    """
+    Calculates the boolean '(N, M)' mask of which of M targets lie in the field
+    of vision of each of N viewers (see 'in_field_of_vision').
+    """
+    viewer = lambda a: np.asarray(a)[:, None]
+    target = lambda a: np.asarray(a)[None, :]
+    return in_field_of_vision(viewer(x), viewer(y), viewer(theta), fov, target(target_x), target(target_y), quantized)
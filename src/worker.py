@@ -0,0 +1,322 @@
+"""
+This module implements running a population in a worker process, which
+publishes what is needed to draw it into shared memory.
+"""
+
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import settings
+import population
+import snapshot
+import checkpoint
+
+class Frame:
+    """
+    One buffer of a 'SharedFrames': the positions, headings and colors of the
+    living bots and the food of a population, published after one tick. Its
+    arrays are views into shared memory and it has the attributes a
+    'Renderer' draws from, so it can be drawn in place of a population.
+    """
+
+    # Entries of 'meta'.
+    BOTS, FOOD, TICKS, MUTATION_RATE = range(4)
+
+    def __init__(self, buffer, offset, bot_capacity, food_capacity):
+        """
+        Lays out a 'Frame' for up to 'bot_capacity' bots and 'food_capacity'
+        food items in 'buffer', starting at byte 'offset'.
+        """
+        arrays = []
+        for dtype, shape in Frame.layout(bot_capacity, food_capacity):
+            arrays.append(np.ndarray(shape, dtype = dtype, buffer = buffer, offset = offset))
+            offset += _aligned(arrays[-1].nbytes)
+        self.meta, self._x, self._y, self._theta, self._rgb, self._food_x, self._food_y = arrays
+        self._alive = np.ones(bot_capacity, dtype = bool)
+
+    @staticmethod
+    def layout(bot_capacity, food_capacity):
+        """
+        The dtype and shape of every array of a 'Frame'.
+        """
+        return [(np.float64, 4), (np.float64, bot_capacity), (np.float64, bot_capacity), (np.float64, bot_capacity),
+            (np.uint8, (bot_capacity, 3)), (np.float64, food_capacity), (np.float64, food_capacity)]
+
+    @staticmethod
+    def size(bot_capacity, food_capacity):
+        """
+        Number of bytes taken by a 'Frame'.
+        """
+        return sum(_aligned(np.dtype(dtype).itemsize * int(np.prod(shape))) for dtype, shape in Frame.layout(bot_capacity, food_capacity))
+
+    @property
+    def ticks(self):
+        return int(self.meta[Frame.TICKS])
+
+    @property
+    def mutation_rate(self):
+        return float(self.meta[Frame.MUTATION_RATE])
+
+    @property
+    def alive(self):
+        return self._alive[:int(self.meta[Frame.BOTS])]
+
+    @property
+    def x(self):
+        return self._x[:int(self.meta[Frame.BOTS])]
+
+    @property
+    def y(self):
+        return self._y[:int(self.meta[Frame.BOTS])]
+
+    @property
+    def theta(self):
+        return self._theta[:int(self.meta[Frame.BOTS])]
+
+    @property
+    def rgb(self):
+        return self._rgb[:int(self.meta[Frame.BOTS])]
+
+    @property
+    def food_x(self):
+        return self._food_x[:int(self.meta[Frame.FOOD])]
+
+    @property
+    def food_y(self):
+        return self._food_y[:int(self.meta[Frame.FOOD])]
+
+    def write(self, pop, ticks):
+        """
+        Copies the state of 'pop' into the frame. Bots and food beyond the
+        frame's capacity are left out.
+        """
+        bots = np.flatnonzero(pop.alive)[:len(self._x)]
+        food = min(len(pop.food_x), len(self._food_x))
+        self._x[:len(bots)] = pop.x[bots]
+        self._y[:len(bots)] = pop.y[bots]
+        self._theta[:len(bots)] = pop.theta[bots]
+        self._rgb[:len(bots)] = pop.rgb[bots]
+        self._food_x[:food] = pop.food_x[:food]
+        self._food_y[:food] = pop.food_y[:food]
+        self.meta[:] = (len(bots), food, ticks, pop.mutation_rate)
+
+class SharedFrames:
+    """
+    A double buffer of 'Frame's in shared memory. The writer publishes into
+    the back frame and then swaps it to the front. A reader uses the front
+    frame in place; while it does, the writer never writes into that frame
+    and skips publishing instead, so neither side ever waits for the other
+    (the lock is only held to swap frames).
+    """
+
+    # Entries of the header: the front frame, the frame being read (or '-1')
+    # and the number of frames published.
+    FRONT, READING, PUBLISHED = range(3)
+
+    def __init__(self, bot_capacity, food_capacity, lock = None, name = None):
+        """
+        Creates 'SharedFrames' holding up to 'bot_capacity' bots and
+        'food_capacity' food items, or, if 'name' is given, attaches to the
+        ones created under that name (with their 'lock').
+        """
+        self.BOT_CAPACITY = bot_capacity
+        self.FOOD_CAPACITY = food_capacity
+        self.lock = multiprocessing.Lock() if lock is None else lock
+        frame_size = Frame.size(bot_capacity, food_capacity)
+        header_size = _aligned(3 * 8)
+        self.memory = shared_memory.SharedMemory(name = name, create = name is None, size = header_size + 2 * frame_size)
+        self.NAME = self.memory.name
+        self._header = np.ndarray(3, dtype = np.int64, buffer = self.memory.buf)
+        self._frames = [Frame(self.memory.buf, header_size + i * frame_size, bot_capacity, food_capacity) for i in range(2)]
+        if name is None:
+            self._header[:] = (0, -1, 0)
+
+    def publish(self, pop, ticks):
+        """
+        Writes the state of 'pop' into the back frame and swaps it to the
+        front. Returns 'False' (and does nothing) if the back frame is still
+        being read.
+        """
+        with self.lock:
+            back = 1 - self._header[SharedFrames.FRONT]
+            if self._header[SharedFrames.READING] == back:
+                return False
+        self._frames[back].write(pop, ticks)
+        with self.lock:
+            self._header[SharedFrames.FRONT] = back
+            self._header[SharedFrames.PUBLISHED] += 1
+        return True
+
+    def acquire(self):
+        """
+        The front frame, which is not written to until 'release' is called,
+        or 'None' if nothing was published yet.
+        """
+        with self.lock:
+            if self._header[SharedFrames.PUBLISHED] == 0:
+                return None
+            front = self._header[SharedFrames.FRONT]
+            self._header[SharedFrames.READING] = front
+            return self._frames[front]
+
+    def release(self):
+        """
+        Lets the writer reuse the frame returned by 'acquire'.
+        """
+        with self.lock:
+            self._header[SharedFrames.READING] = -1
+
+    def close(self):
+        """
+        Detaches from the shared memory. The frames cannot be used anymore.
+        """
+        self._header = None
+        self._frames = None
+        self.memory.close()
+
+    def unlink(self):
+        """
+        Frees the shared memory (once every process has closed it).
+        """
+        self.memory.unlink()
+
+class SimulationWorker:
+    """
+    Steps a population in a separate process, so that drawing it and stepping
+    it never stall each other. The worker paces itself like the main loop
+    (see 'settings') and publishes every tick into 'frames'. Changes (food
+    placement, resets, pausing, mutation rate and time multiplier) are sent to
+    it over a queue.
+    """
+
+    def __init__(self, pop, food_capacity = None, checkpoint_dir = None):
+        """
+        Starts stepping 'pop' in a worker process. 'food_capacity' is the
+        largest number of food items published (by default, at least 64 and
+        twice the current number). If 'checkpoint_dir' is given, the worker
+        checkpoints the population there every half hour.
+        """
+        if food_capacity is None:
+            food_capacity = max(64, 2 * len(pop.food_x))
+        self.frames = SharedFrames(2 * pop.SIZE, food_capacity)
+        self._mutation_rate = pop.mutation_rate
+        self._commands = multiprocessing.Queue()
+        config = settings.capture()
+        self.process = multiprocessing.Process(target = _simulation_worker,
+            args = (self.frames.NAME, self.frames.BOT_CAPACITY, self.frames.FOOD_CAPACITY, self.frames.lock, self._commands, pop, config, checkpoint_dir),
+            daemon = True)
+        self.process.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def mutation_rate(self):
+        return self._mutation_rate
+
+    @mutation_rate.setter
+    def mutation_rate(self, value):
+        self._mutation_rate = value
+        self._commands.put(("mutation_rate", value))
+
+    def set_time_multiplier(self, value):
+        """
+        Sets the worker's 'settings.TIME_MULTIPLIER'.
+        """
+        self._commands.put(("time_multiplier", value))
+
+    def place_food(self, x, y):
+        self._commands.put(("place_food", (x, y)))
+
+    def reset(self):
+        """
+        Replaces the population with a new random one of the same size.
+        """
+        self._commands.put(("reset", None))
+
+    def toggle_pause(self):
+        self._commands.put(("pause", None))
+
+    def save(self, path):
+        """
+        Saves the population to 'path' (see 'snapshot.save').
+        """
+        self._commands.put(("save", path))
+
+    def close(self):
+        """
+        Stops the worker (after it finished writing any checkpoint) and frees
+        the shared memory.
+        """
+        if self.process is None:
+            return
+        self._commands.put(("stop", None))
+        self.process.join()
+        self.process = None
+        self.frames.close()
+        self.frames.unlink()
+
+def _simulation_worker(name, bot_capacity, food_capacity, lock, commands, pop, config, checkpoint_dir):
+    """
+    Steps 'pop', following the commands sent over 'commands', and publishes
+    every tick into the 'SharedFrames' called 'name'.
+    """
+    settings.apply(config)
+    frames = SharedFrames(bot_capacity, food_capacity, lock, name)
+    checkpoints = None
+    if checkpoint_dir is not None:
+        checkpoints = checkpoint.CheckpointManager(checkpoint_dir, report = checkpoint.print_report)
+    ticks = 0
+    paused = False
+    last = time.perf_counter()
+    while True:
+        try:
+            while True:
+                command, arg = commands.get_nowait()
+                if command == "stop":
+                    if checkpoints is not None:
+                        checkpoints.wait()
+                    frames.close()
+                    return
+                elif command == "reset":
+                    pop = population.Population(pop.SIZE, pop.mutation_rate, world = pop.world, hidden = pop.HIDDEN)
+                elif command == "pause":
+                    paused = not paused
+                elif command == "place_food":
+                    pop.place_food(*arg)
+                elif command == "mutation_rate":
+                    pop.mutation_rate = arg
+                elif command == "time_multiplier":
+                    settings.TIME_MULTIPLIER = arg
+                elif command == "save":
+                    snapshot.save(arg, pop)
+        except queue.Empty:
+            pass
+
+        # Ticks are paced and sized like the frames of the main loop: 'dt' is
+        # the number of frames (at the target frame rate) since the last tick.
+        fps = int(settings.FPS / (settings.TIME_MULTIPLIER / 5.0 + 1))
+        now = time.perf_counter()
+        if now < last + 1.0 / fps:
+            time.sleep(last + 1.0 / fps - now)
+            now = time.perf_counter()
+        dt = (now - last) * fps
+        last = now
+        if paused:
+            continue
+        if checkpoints is not None and checkpoints.due():
+            checkpoints.checkpoint(pop)
+        pop.update(dt)
+        ticks += 1
+        frames.publish(pop, ticks)
+
+def _aligned(size):
+    """
+    'size' rounded up to a multiple of 8 bytes.
+    """
+    return (size + 7) // 8 * 8
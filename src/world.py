@@ -0,0 +1,84 @@
+"""
+This module implements the configuration of the world a population lives in:
+how much food there is, where it spawns and what the bots sense.
+"""
+
+import numpy as np
+
+class World:
+    """
+    The configuration of a population's world. Bots sense food either with a
+    single field-of-vision sensor ('rays' is '0': the input is '1.0' if there
+    is food in sight and '0.0' otherwise, as in the original game) or with
+    'rays' distance sensors spread evenly over 'ray_spread' radians around
+    their heading, each reporting the distance to the nearest food item along
+    it as a fraction of 'ray_length' ('1.0' if it hits none). The size of the
+    networks' input layer follows from the sensors (see 'INPUTS').
+    If 'quantized_vision' is set, the field-of-vision sensor rounds angles to
+    whole degrees like the original scalar helpers did (see
+    'utility.in_field_of_vision'); it is on by default so that runs (and saved
+    populations) behave as before. Otherwise the exact, faster dot-product
+    test is used.
+    """
+
+    def __init__(self, food = 1, food_region = None, rays = 0, ray_spread = np.pi / 2, ray_length = 300.0, quantized_vision = True):
+        """
+        Creates a 'World' with 'food' food items. Food spawns uniformly within
+        'food_region', a '(left, top, right, bottom)' rectangle in pixels, or,
+        if it is 'None', anywhere on the map away from where bots spawn.
+        """
+        assert(food >= 1)
+        assert(rays >= 0)
+        assert(ray_spread >= 0)
+        assert(ray_length > 0)
+        if food_region is not None:
+            food_region = tuple(float(v) for v in food_region)
+            assert(len(food_region) == 4 and food_region[0] < food_region[2] and food_region[1] < food_region[3])
+        self.FOOD = int(food)
+        self.FOOD_REGION = food_region
+        self.RAYS = int(rays)
+        self.RAY_SPREAD = float(ray_spread)
+        self.RAY_LENGTH = float(ray_length)
+        self.QUANTIZED_VISION = bool(quantized_vision)
+
+    @property
+    def INPUTS(self):
+        """
+        Number of input neurons of the networks.
+        """
+        return self.RAYS if self.RAYS > 0 else 1
+
+    def ray_angles(self):
+        """
+        The direction of every ray relative to the bot's heading, in radians.
+        """
+        if self.RAYS == 1:
+            return np.zeros(1)
+        return np.linspace(-self.RAY_SPREAD / 2, self.RAY_SPREAD / 2, self.RAYS)
+
+    def to_dict(self):
+        """
+        The configuration as a JSON-compatible dictionary.
+        """
+        return {
+            "food": self.FOOD,
+            "food_region": None if self.FOOD_REGION is None else list(self.FOOD_REGION),
+            "rays": self.RAYS,
+            "ray_spread": self.RAY_SPREAD,
+            "ray_length": self.RAY_LENGTH,
+            "quantized_vision": self.QUANTIZED_VISION,
+        }
+
+    @classmethod
+    def from_dict(cls, config):
+        """
+        The 'World' described by a dictionary made by 'to_dict' (missing
+        entries take their default values).
+        """
+        return cls(**config)
+
+    def __eq__(self, other):
+        return isinstance(other, World) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return "World(%s)" % ", ".join("%s = %r" % item for item in self.to_dict().items())